@@ -2,20 +2,36 @@ from api.utils.database import db
 from marshmallow_sqlalchemy import SQLAlchemyAutoSchema
 from marshmallow import fields
 from datetime import datetime,timezone
-from sqlalchemy.orm import validates
-from api.models.books import BookSchema
+from sqlalchemy import select, func
+from sqlalchemy.orm import validates, column_property
+from api.models.books import Book, BookSchema
+from api.utils.cache import cache
+from api.utils.avatars import release_avatar, collect_garbage
 
 class Author(db.Model):
   __tablename__ = 'authors'
 
   id = db.Column(db.Integer, primary_key=True, autoincrement=True)
   first_name = db.Column(db.String(20))
-  last_name = db.Column(db.String(20), nullable=False)
+  last_name = db.Column(db.String(20), nullable=False, index=True)
   avatar = db.Column(db.String(100), nullable=True)
   created_at = db.Column(db.DateTime,  default=lambda: datetime.now(timezone.utc)) 
-  updated_at = db.Column(db.DateTime,  default=lambda: datetime.now(timezone.utc))
+  # Indexed for the search index refresh.
+  updated_at = db.Column(db.DateTime,  default=lambda: datetime.now(timezone.utc), index=True)
+  # Checked by every UPDATE/DELETE of the row; a concurrent change makes the
+  # flush raise StaleDataError instead of overwriting it.
+  version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+  __mapper_args__ = {'version_id_col': version}
   
   books = db.relationship('Book', backref='Author', cascade="all, delete-orphan")
+  book_count = column_property(
+    select(func.count(Book.id))
+    .where(Book.author_id == id)
+    .correlate_except(Book)
+    .scalar_subquery(),
+    deferred=True
+  )
 
   @validates("first_name", "last_name")
   def validate_name(self, key, name):
@@ -31,16 +47,21 @@ class Author(db.Model):
   def create(self):
     db.session.add(self)
     db.session.commit()
+    cache.invalidate('author', self.id)
     return self
   
   def update(self):
     self.updated_at = datetime.now(timezone.utc)
     db.session.commit()
+    cache.invalidate('author', self.id)
     return self
   
   def delete(self):
+    avatar = release_avatar(self.avatar)
     db.session.delete(self)
     db.session.commit()
+    cache.invalidate('author', self.id)
+    collect_garbage([avatar])
     return self
   
 class AuthorSchema(SQLAlchemyAutoSchema):
@@ -57,5 +78,7 @@ class AuthorSchema(SQLAlchemyAutoSchema):
   avatar = fields.String(dump_only=True)
   created_at = fields.DateTime(dump_only=True)
   updated_at = fields.DateTime(dump_only=True)
+  version = fields.Integer(dump_only=True)
   books = fields.Nested('BookSchema', many=True, exclude=('author_id',))
+  book_count = fields.Integer(dump_only=True)
 
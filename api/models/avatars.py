@@ -0,0 +1,18 @@
+from api.utils.database import db
+from datetime import datetime, timezone
+
+class AvatarBlob(db.Model):
+  __tablename__ = 'avatar_blobs'
+
+  digest = db.Column(db.String(64), primary_key=True)
+  extension = db.Column(db.String(10), nullable=False)
+  size = db.Column(db.Integer, nullable=False)
+  ref_count = db.Column(db.Integer, nullable=False, default=0)
+  created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+  @property
+  def filename(self):
+    return f"{self.digest}.{self.extension}"
+
+  def __repr__(self):
+    return f'<AvatarBlob {self.filename}'
@@ -2,16 +2,24 @@ from api.utils.database import db
 from marshmallow_sqlalchemy import SQLAlchemyAutoSchema
 from marshmallow import fields
 from datetime import datetime,timezone
+from sqlalchemy import inspect
+from api.utils.cache import cache
 
 class Book(db.Model):
   __tablename__ = 'books'
+  __table_args__ = (
+    db.Index('ix_books_author_id_year', 'author_id', 'year'),
+  )
 
   id = db.Column(db.Integer, primary_key=True, autoincrement=True)
   title = db.Column(db.String(50), nullable=False)
   year = db.Column(db.Integer, nullable=False)
-  author_id = db.Column(db.Integer, db.ForeignKey("authors.id"))
+  author_id = db.Column(db.Integer, db.ForeignKey("authors.id"), index=True)
   created_at = db.Column(db.DateTime,  default=lambda: datetime.now(timezone.utc))
-  updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+  updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+  version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+  __mapper_args__ = {'version_id_col': version}
 
   # author = db.relationship("Author", back_populates="Book")
 
@@ -21,16 +29,26 @@ class Book(db.Model):
   def create(self):
     db.session.add(self)
     db.session.commit()
+    self.invalidate_cache()
     return self
   
   def update(self):
+    self.updated_at = datetime.now(timezone.utc)
+    previous_authors = inspect(self).attrs.author_id.history.deleted
     db.session.commit()
+    self.invalidate_cache(*previous_authors)
     return self
   
   def delete(self):
     db.session.delete(self)
     db.session.commit()
+    self.invalidate_cache()
     return self
+
+  def invalidate_cache(self, *previous_authors):
+    # Authors embed their books, so the owning author goes too.
+    cache.invalidate('book', self.id)
+    cache.invalidate('author', self.author_id, *previous_authors)
   
 class BookSchema(SQLAlchemyAutoSchema):
   class Meta:
@@ -45,4 +63,5 @@ class BookSchema(SQLAlchemyAutoSchema):
   year = fields.Integer(required=True)
   author_id = fields.Integer(required=True)
   created_at = fields.DateTime(dump_only=True)
-  updated_at = fields.DateTime(dump_only=True)
\ No newline at end of file
+  updated_at = fields.DateTime(dump_only=True)
+  version = fields.Integer(dump_only=True)
\ No newline at end of file
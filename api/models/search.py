@@ -0,0 +1,13 @@
+from api.utils.database import db
+from datetime import datetime, timezone
+
+class SearchTombstone(db.Model):
+  __tablename__ = 'search_tombstones'
+
+  id = db.Column(db.Integer, primary_key=True)
+  kind = db.Column(db.String(20), nullable=False)
+  doc_id = db.Column(db.Integer, nullable=False)
+  deleted_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+
+  def __repr__(self):
+    return f'<SearchTombstone {self.kind}:{self.doc_id}>'
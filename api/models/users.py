@@ -1,6 +1,7 @@
 from datetime import datetime, timezone
 from api.utils.database import db
-from passlib.hash import pbkdf2_sha256 as sha256
+from api.utils.hashing import hasher
+from api.utils.write_behind import TimestampBuffer
 from marshmallow_sqlalchemy import SQLAlchemyAutoSchema
 from marshmallow import fields, validates, ValidationError
 import re
@@ -47,20 +48,27 @@ class User(db.Model):
   
   @staticmethod
   def generate_hash(password):
-    return sha256.hash(password)
+    return hasher.hash(password)
   
   @staticmethod
   def verify_hash(password, hash):
-    return sha256.verify(password, hash)
+    return hasher.verify(password, hash)
+
+  @staticmethod
+  def needs_rehash(hash):
+    return hasher.needs_rehash(hash)
   
   def update_last_login(self):
-    self.last_login = datetime.now(timezone.utc)
-    db.session.commit()
+    # Written by the batched flusher, off the login request path.
+    last_logins.record(self.id)
 
   def __repr__(self):
     return f'<User {self.username}'
   
 
+last_logins = TimestampBuffer(User, 'last_login')
+
+
 class UserSchema(SQLAlchemyAutoSchema):
   class Meta:
     model = User
@@ -0,0 +1,239 @@
+"""Native ASGI handlers for the author and book reads.
+
+These handlers mirror the GET views in authors.py and books.py, sharing
+their filters, validators, cache entries and schemas. Each query is awaited
+on the asyncio engine, so a request waiting on the database does not hold
+a thread. Listings read from a replica when READ_REPLICA_BINDS is set;
+detail reads fill the shared cache, so they stay on the primary, as in the
+sync views. Cache and user generation lookups may block on the SQLite
+cache file, so they run in a worker thread. Streamed listings are served
+by the WSGI views.
+"""
+import asyncio
+from flask import request
+from flask_jwt_extended import verify_jwt_in_request, decode_token
+from flask_jwt_extended.config import config as jwt_config
+from sqlalchemy import select
+from api.utils.asgi import async_route, async_db
+from api.utils.auth import jwt, user_status_query, remember_user, cached_user
+from api.utils.responses import response_with
+from api.utils import responses as resp
+from api.models.authors import Author
+from api.models.books import Book, BookSchema
+from api.routes.authors import (
+  include_books, author_load_options, make_author_schema, author_list_query,
+  author_key_columns, author_book_stats, author_validators
+)
+from api.routes.books import book_list_query, book_key_columns, book_validators
+from api.utils.filters import InvalidFilter
+from api.utils.pagination import page_args, keyset_query, keyset_page, order_by, InvalidPageRequest
+from api.utils.streaming import stream_requested
+from api.utils.serializers import dump
+from api.utils.conditional import not_modified, set_validators, entry_response
+from api.utils.cache import cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def token_identity():
+  """The identity of the request's header token, or None."""
+  parts = request.headers.get(jwt_config.header_name, '').split()
+  expected = [jwt_config.header_type] if jwt_config.header_type else []
+  if len(parts) != len(expected) + 1 or parts[:-1] != expected:
+    return None
+  try:
+    return decode_token(parts[-1])[jwt_config.identity_claim_key]
+  except Exception:
+    return None
+
+
+def token_generation():
+  """The header token's identity, with its user generation read onto `g`."""
+  username = token_identity()
+  if username is not None:
+    jwt.generation(username)
+  return username
+
+
+async def async_jwt_required():
+  # Resolve the user status here, so that the user lookup inside
+  # verify_jwt_in_request finds it on `g` instead of running a blocking
+  # query on the event loop. Decoding the token and reading the shared
+  # generation may touch the SQLite cache file, so they run in a thread.
+  # Bad tokens are left for verify_jwt_in_request to reject.
+  username = await asyncio.to_thread(token_generation)
+  if username is not None and cached_user(username) is None:
+    generation = jwt.generation(username)
+    async with async_db.session() as session:
+      row = (await session.execute(user_status_query(username))).first()
+    remember_user(username, row, generation)
+  verify_jwt_in_request()
+
+
+@async_route("/api/authors/", unless=stream_requested)
+async def get_all_authors():
+  await async_jwt_required()
+  try:
+    async with async_db.read_session() as session:
+      with_books = include_books()
+      filtered, columns, descending = author_list_query.apply(select(Author))
+      limit, cursor = page_args()
+
+      keys = (await session.execute(keyset_query(
+        filtered.with_only_columns(*author_key_columns(columns)),
+        columns, limit, cursor, descending
+      ))).all()
+      keys, pagination = keyset_page(keys, columns, limit)
+      ids = [key.id for key in keys]
+      stats = (await session.execute(author_book_stats(ids))).all() if ids else []
+      etag, last_modified = author_validators(
+        keys, with_books, pagination['next_cursor'], stats=stats
+      )
+      cached = not_modified(etag, last_modified)
+      if cached:
+        return cached
+
+      authors = (await session.scalars(
+        select(Author).options(*author_load_options(with_books))
+                      .where(Author.id.in_(ids))
+                      .order_by(*order_by(columns, descending))
+      )).all()
+      result = dump(make_author_schema(with_books, many=True), authors)
+
+    return set_validators(
+      response_with(
+        resp.SUCCESS_200,
+        value={"authors": result},
+        pagination=pagination
+      ),
+      etag,
+      last_modified
+    )
+
+  except (InvalidPageRequest, InvalidFilter) as e:
+    return response_with(resp.BAD_REQUEST_400, message=str(e))
+  except Exception as e:
+    logger.error(f"Error fetching authors: {str(e)}")
+    return response_with(resp.SERVER_ERROR_500)
+
+
+@async_route("/api/authors/<int:author_id>")
+async def get_author_by_id(author_id):
+  await async_jwt_required()
+  try:
+    with_books = include_books()
+    variant = 'books' if with_books else 'book_count'
+    entry = await asyncio.to_thread(cache.get, 'author', author_id, variant)
+    if entry is not None:
+      return entry_response("author", entry, 'HIT')
+
+    generation = await asyncio.to_thread(cache.generation, 'author', author_id)
+    async with async_db.session() as session:
+      keys = (await session.execute(
+        select(*author_key_columns()).where(Author.id == author_id)
+      )).all()
+      if not keys:
+        return response_with(resp.SERVER_ERROR_404)
+
+      stats = (await session.execute(author_book_stats([author_id]))).all()
+      etag, last_modified = author_validators(keys, with_books, stats=stats)
+      cached = not_modified(etag, last_modified)
+      if cached:
+        return cached
+
+      author = await session.get(
+        Author, author_id, options=author_load_options(with_books)
+      )
+      if not author:
+        return response_with(resp.SERVER_ERROR_404)
+      payload = dump(make_author_schema(with_books), author)
+
+    entry = await asyncio.to_thread(
+      cache.store, 'author', author_id, variant, generation, payload, etag, last_modified
+    )
+    return entry_response("author", entry, 'MISS')
+
+  except Exception as e:
+    logger.error(f"Error fetching author: {str(e)}")
+    return response_with(resp.SERVER_ERROR_500)
+
+
+@async_route("/api/books/", unless=stream_requested)
+async def get_all_books():
+  try:
+    query, columns, descending = book_list_query.apply(select(Book))
+    limit, cursor = page_args()
+
+    async with async_db.read_session() as session:
+      keys = (await session.execute(keyset_query(
+        query.with_only_columns(*book_key_columns(columns)),
+        columns, limit, cursor, descending
+      ))).all()
+      keys, pagination = keyset_page(keys, columns, limit)
+      etag, last_modified = book_validators(keys, pagination['next_cursor'])
+      cached = not_modified(etag, last_modified)
+      if cached:
+        return cached
+
+      books = (await session.scalars(
+        select(Book).where(Book.id.in_([key.id for key in keys]))
+                    .order_by(*order_by(columns, descending))
+      )).all()
+    result = dump(BookSchema(many=True), books)
+
+    return set_validators(
+      response_with(
+        resp.SUCCESS_200,
+        value={"books": result},
+        pagination=pagination
+      ),
+      etag,
+      last_modified
+    )
+
+  except (InvalidPageRequest, InvalidFilter) as e:
+    return response_with(resp.BAD_REQUEST_400, message=str(e))
+  except Exception as e:
+    logger.error(f"Error while fetching books: {str(e)}")
+    return response_with(resp.SERVER_ERROR_500)
+
+
+@async_route("/api/books/<int:id>")
+async def get_book_by_id(id):
+  try:
+    entry = await asyncio.to_thread(cache.get, 'book', id, 'book')
+    if entry is not None:
+      return entry_response("book", entry, 'HIT')
+
+    generation = await asyncio.to_thread(cache.generation, 'book', id)
+    async with async_db.session() as session:
+      keys = (await session.execute(
+        select(*book_key_columns()).where(Book.id == id)
+      )).all()
+      if not keys:
+        return response_with(
+          resp.SERVER_ERROR_404,
+          message=f"Book with id {id} not found!"
+        )
+
+      etag, last_modified = book_validators(keys)
+      cached = not_modified(etag, last_modified)
+      if cached:
+        return cached
+
+      book = await session.get(Book, id)
+      if not book:
+        return response_with(
+          resp.SERVER_ERROR_404,
+          message=f"Book with id {id} not found!"
+        )
+
+    entry = await asyncio.to_thread(
+      cache.store, 'book', id, 'book', generation, dump(BookSchema(), book), etag, last_modified
+    )
+    return entry_response("book", entry, 'MISS')
+
+  except Exception as e:
+    logger.error(f"Error while fetching book: {str(e)}")
+    return response_with(resp.SERVER_ERROR_500)
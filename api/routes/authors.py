@@ -1,15 +1,29 @@
 from flask import Blueprint, request, current_app, url_for
-from werkzeug.utils import secure_filename
-from api.utils.responses import response_with
+from api.utils.responses import response_with, stream_response_with
 from api.utils import responses as resp
 from api.models.authors import Author, AuthorSchema
-from api.utils.database import db
+from api.models.books import Book
+from api.utils.database import db, replica_reads, primary_reads
+from api.utils.filters import ListQuery, Filter, Sort, InvalidFilter, prefix
+from api.utils.pagination import page_args, keyset_paginate, order_by, InvalidPageRequest
+from api.utils.streaming import stream_requested, dump_chunks
+from api.utils.serializers import dump
+from api.utils.conditional import (
+  make_etag, latest, not_modified, precondition_failed, set_validators, entry_response
+)
+from api.utils.cache import cache
+from api.utils.search import search_index
+from api.utils.avatars import (
+  receive_avatar, acquire_avatar, place_avatar, release_avatar, release_avatars,
+  collect_garbage
+)
+from api.utils.bulk import bulk_payload, bulk_ids, load_items, insert_rows, InvalidBulkRequest
+from sqlalchemy import func, select, delete, exists
+from sqlalchemy.orm import selectinload, undefer
 from sqlalchemy.orm.exc import StaleDataError
 from datetime import datetime, timezone
 from flask_jwt_extended import jwt_required
 import logging
-import os
-import uuid
 
 
 logger = logging.getLogger(__name__)
@@ -20,6 +34,64 @@ allowed_extensions = set(['image/jpeg', 'image/png', 'jpeg'])
 def allowed_file(filetype):
   return filetype in allowed_extensions
 
+def include_books():
+  include = request.args.get('include', '')
+  return 'books' in {part.strip() for part in include.split(',')}
+
+def author_load_options(with_books):
+  # Books are fetched in one batched SELECT ... IN for the whole page;
+  # otherwise only a correlated COUNT is added to the author query.
+  if with_books:
+    return [selectinload(Author.books)]
+  return [undefer(Author.book_count)]
+
+def make_author_schema(with_books=True, **kwargs):
+  exclude = ('book_count',) if with_books else ('books',)
+  return AuthorSchema(exclude=exclude, **kwargs)
+
+author_list_query = ListQuery(
+  filters={
+    'last_name': Filter(Author.last_name, prefix),
+  },
+  sorts={
+    'id': Sort(Author.id),
+    'last_name': Sort(Author.last_name, Author.id),
+  },
+  default_sort='id'
+)
+
+def author_key_columns(columns=()):
+  return list(columns) + [c for c in (Author.id, Author.updated_at, Author.version)
+                         if c not in columns]
+
+def author_keys(query, columns=()):
+  return query.with_entities(*author_key_columns(columns))
+
+def author_book_stats(ids):
+  return select(Book.author_id, func.max(Book.updated_at), func.count(Book.id))\
+    .where(Book.author_id.in_(ids)).group_by(Book.author_id)
+
+def has_books(author_id):
+  # An index probe on books.author_id, not a load of the author's books.
+  return exists().where(Book.author_id == author_id)
+
+def author_validators(keys, with_books, *extra, stats=None):
+  # Both representations embed book data (the nested list or book_count),
+  # so the newest book timestamp and the book count are part of the tag.
+  # `stats` are the author_book_stats rows, fetched here when not given.
+  ids = [key.id for key in keys]
+  if stats is None:
+    stats = db.session.execute(author_book_stats(ids)).all() if ids else []
+  stats = {author_id: (updated_at, count) for author_id, updated_at, count in stats}
+
+  etag = make_etag(
+    'authors', with_books, [tuple(key) for key in keys], sorted(stats.items()), *extra
+  )
+  last_modified = latest(
+    [key.updated_at for key in keys] + [updated_at for updated_at, _ in stats.values()]
+  )
+  return etag, last_modified
+
 @author_routes.route("/", methods = ['POST'])
 @jwt_required()
 def create_author():
@@ -28,7 +100,7 @@ def create_author():
     if not data:
        response_with(resp.BAD_REQUEST_400)
     
-    author_schema = AuthorSchema()
+    author_schema = make_author_schema()
     author = author_schema.load(data)
     result = author_schema.dump(author.create())
 
@@ -41,33 +113,120 @@ def create_author():
     print(e)
     return response_with(resp.INVALID_INPUT_422)
 
+@author_routes.route("/bulk", methods = ['POST'])
+@jwt_required()
+def create_authors_bulk():
+  try:
+    data = bulk_payload()
+    author_schema = AuthorSchema(exclude=('books', 'book_count'), transient=True)
+    authors, errors = load_items(author_schema, data)
+
+    if not authors:
+      return response_with(resp.INVALID_INPUT_422, error=errors)
+
+    insert_rows(Author, [
+      {'first_name': author.first_name, 'last_name': author.last_name}
+      for author in authors.values()
+    ])
+    db.session.commit()
+    search_index.catch_up('author')
+
+    return response_with(
+      resp.SUCCESS_201,
+      value={"created": len(authors)},
+      error=errors or None
+    )
+
+  except InvalidBulkRequest as e:
+    return response_with(resp.BAD_REQUEST_400, message=str(e))
+  except Exception as e:
+    db.session.rollback()
+    logger.error(f"Error while bulk creating authors: {str(e)}")
+    return response_with(resp.INVALID_INPUT_422)
+
 @author_routes.route("/", methods = ['GET'])
 @jwt_required()
+@replica_reads
 def get_all_authors():
   try:
-    authors = Author.query.all()
-    author_schema = AuthorSchema(many=True)
+    with_books = include_books()
+    filtered, columns, descending = author_list_query.apply(Author.query)
+    query = filtered.options(*author_load_options(with_books))
+    author_schema = make_author_schema(with_books, many=True)
+
+    if stream_requested():
+      return stream_response_with(
+        resp.SUCCESS_200,
+        "authors",
+        dump_chunks(query, columns, author_schema, descending=descending)
+      )
+
+    limit, cursor = page_args()
+    keys, pagination = keyset_paginate(
+      author_keys(filtered, columns), columns, limit, cursor, descending
+    )
+    etag, last_modified = author_validators(
+      keys, with_books, pagination['next_cursor']
+    )
+    cached = not_modified(etag, last_modified)
+    if cached:
+      return cached
 
-    result = author_schema.dump(authors)
+    authors = Author.query.options(*author_load_options(with_books))\
+                          .filter(Author.id.in_([key.id for key in keys]))\
+                          .order_by(*order_by(columns, descending)).all()
+    result = dump(author_schema, authors)
 
-    return response_with(resp.SUCCESS_200, value={"authors": result})
+    return set_validators(
+      response_with(
+        resp.SUCCESS_200,
+        value={"authors": result},
+        pagination=pagination
+      ),
+      etag,
+      last_modified
+    )
   
+  except (InvalidPageRequest, InvalidFilter) as e:
+    return response_with(resp.BAD_REQUEST_400, message=str(e))
   except Exception as e:
     logger.error(f"Error fetching authors: {str(e)}")
     return response_with(resp.SERVER_ERROR_500)
 
 @author_routes.route("/<int:author_id>", methods = ['GET'])
 @jwt_required()
+@replica_reads
 def get_author_by_id(author_id):
   try:
-    author = db.session.get(Author, author_id)
-    if not author:
+    with_books = include_books()
+    variant = 'books' if with_books else 'book_count'
+    entry = cache.get('author', author_id, variant)
+    if entry is not None:
+      return entry_response("author", entry, 'HIT')
+
+    generation = cache.generation('author', author_id)
+    primary_reads()
+    keys = author_keys(Author.query).filter(Author.id == author_id).all()
+    if not keys:
       return response_with(resp.SERVER_ERROR_404)
-    author_schema = AuthorSchema()
 
-    result = author_schema.dump(author)
+    etag, last_modified = author_validators(keys, with_books)
+    cached = not_modified(etag, last_modified)
+    if cached:
+      return cached
+
+    author = db.session.get(
+      Author, author_id, options=author_load_options(with_books)
+    )
+    if not author:
+      return response_with(resp.SERVER_ERROR_404)
+    author_schema = make_author_schema(with_books)
 
-    return response_with(resp.SUCCESS_200, value={"author": result})
+    entry = cache.store(
+      'author', author_id, variant, generation,
+      dump(author_schema, author), etag, last_modified
+    )
+    return entry_response("author", entry, 'MISS')
   
   except Exception as e:
     logger.error(f"Error fetching author: {str(e)}")
@@ -84,20 +243,29 @@ def update_author_by_id(author_id):
           message="No input provided"
         )
       
-      author = db.session.query(Author).with_for_update().get(author_id)
+      # No row lock: the version column makes a concurrent write fail the
+      # UPDATE below instead of being overwritten.
+      author = db.session.get(Author, author_id)
       if not author:
         return response_with(
           resp.SERVER_ERROR_404,
           message=f"Author with id {author_id} not found"
         )
+
+      if request.if_match:
+        # Either representation's ETag identifies the version the client saw.
+        keys = author_keys(Author.query).filter(Author.id == author_id).all()
+        stats = db.session.execute(author_book_stats([author_id])).all()
+        etags = [author_validators(keys, with_books, stats=stats)[0]
+                 for with_books in (True, False)]
+        if precondition_failed(*etags):
+          db.session.rollback()
+          return response_with(resp.PRECONDITION_FAILED_412)
       
       try:
-        author_schema = AuthorSchema(partial=True)
+        author_schema = make_author_schema(partial=True)
         updated_author = author_schema.load(data, instance=author)
-        updated_author.updated_at = datetime.now(timezone.utc)
-
-        db.session.add(updated_author)
-        db.session.commit()
+        updated_author.update()
 
         current_app.logger.info(
             f"Author {author_id} updated by user at {datetime.now(timezone.utc)}"
@@ -113,7 +281,7 @@ def update_author_by_id(author_id):
       except StaleDataError:
           db.session.rollback()
           return response_with(
-              resp.INVALID_INPUT_422,
+              resp.CONFLICT_409,
               message="Data was updated by another user. Please refresh and try again"
           )
       except Exception as e:
@@ -130,46 +298,129 @@ def update_author_by_id(author_id):
 @jwt_required()
 def delete_author_by_id(author_id):
   try:
-    with db.session.begin():
-      author = db.session.query(Author)\
-                     .with_for_update()\
-                     .get(author_id)
-      
-      if not author:
-        return response_with(
-          resp.SERVER_ERROR_404,
-          message=f"Author with id {author_id} not found"
-        )
-      
-      if author.books:
-        return response_with(
-          resp.BAD_REQUEST_400,
-          message="Cannot delete author with existing books"
-        )
-      
-      try:
-        db.session.delete(author)
+    author = db.session.get(Author, author_id)
+    
+    if not author:
+      return response_with(
+        resp.SERVER_ERROR_404,
+        message=f"Author with id {author_id} not found"
+      )
+    
+    if db.session.scalar(select(has_books(author_id))):
+      db.session.rollback()
+      return response_with(
+        resp.BAD_REQUEST_400,
+        message="Cannot delete author with existing books"
+      )
+    
+    try:
+      author.delete()
 
-        current_app.logger.info(
-          f"Author {author_id} deleted by user at {datetime.now(timezone.utc)}"
-        )
+      current_app.logger.info(
+        f"Author {author_id} deleted by user at {datetime.now(timezone.utc)}"
+      )
 
-        return response_with(
-          resp.SUCCESS_204,
-          message="Author deleted successfully"
-        )
-      
-      except Exception as e:
-        db.session.rollback(),
-        current_app.logger.error(
-          f"Failed to delete author {author_id}: {str(e)}"
-        )
-        raise e
+      return response_with(
+        resp.SUCCESS_204,
+        message="Author deleted successfully"
+      )
+
+    except StaleDataError:
+      db.session.rollback()
+      return response_with(
+        resp.CONFLICT_409,
+        message="Data was updated by another user. Please refresh and try again"
+      )
+    except Exception as e:
+      db.session.rollback()
+      current_app.logger.error(
+        f"Failed to delete author {author_id}: {str(e)}"
+      )
+      raise e
 
   except Exception as e:
     logger.error(f"Error deleting author: {str(e)}")
     return response_with(resp.SERVER_ERROR_500)
   
+@author_routes.route("/", methods = ['DELETE'])
+@jwt_required()
+def delete_authors_bulk():
+  try:
+    ids, data = bulk_ids()
+    cascade = data.get('cascade', False)
+    if not isinstance(cascade, bool):
+      return response_with(resp.BAD_REQUEST_400, message="cascade must be a boolean")
+
+    rows = db.session.execute(
+      select(Author.id, Author.avatar).where(Author.id.in_(ids))
+    ).all()
+    found = {row.id for row in rows}
+    errors = {
+      str(id): {'id': [f"Author with id {id} not found"]}
+      for id in ids if id not in found
+    }
+
+    if not cascade and found:
+      blocked = set(db.session.scalars(
+        select(Book.author_id).where(Book.author_id.in_(found)).distinct()
+      ))
+      for id in blocked:
+        errors[str(id)] = {'id': ["Cannot delete author with existing books"]}
+      rows = [row for row in rows if row.id not in blocked]
+
+    if not rows:
+      return response_with(resp.INVALID_INPUT_422, error=errors)
+
+    author_ids = [row.id for row in rows]
+    book_ids = []
+    if cascade:
+      book_ids = db.session.scalars(
+        select(Book.id).where(Book.author_id.in_(author_ids))
+      ).all()
+      db.session.execute(
+        delete(Book).where(Book.author_id.in_(author_ids))
+                    .execution_options(synchronize_session=False)
+      )
+
+    # The guard catches books added by a concurrent request since the
+    # checks above; the whole batch is then retried by the client.
+    deleted = db.session.execute(
+      delete(Author).where(Author.id.in_(author_ids), ~has_books(Author.id))
+                    .execution_options(synchronize_session=False)
+    ).rowcount
+    if deleted != len(author_ids):
+      db.session.rollback()
+      return response_with(
+        resp.CONFLICT_409,
+        message="Books were added to these authors meanwhile, please retry"
+      )
+
+    released = release_avatars([row.avatar for row in rows])
+    search_index.remove('author', author_ids)
+    search_index.remove('book', book_ids)
+    db.session.commit()
+
+    cache.invalidate('author', *author_ids)
+    cache.invalidate('book', *book_ids)
+    collect_garbage(released)
+
+    current_app.logger.info(
+      f"{len(author_ids)} authors and {len(book_ids)} books deleted by user at "
+      f"{datetime.now(timezone.utc)}"
+    )
+
+    value = {"deleted": len(author_ids)}
+    if cascade:
+      value["deleted_books"] = len(book_ids)
+    return response_with(resp.SUCCESS_200, value=value, error=errors or None)
+
+  except InvalidBulkRequest as e:
+    return response_with(resp.BAD_REQUEST_400, message=str(e))
+  except Exception as e:
+    db.session.rollback()
+    logger.error(f"Error while bulk deleting authors: {str(e)}")
+    return response_with(resp.SERVER_ERROR_500)
+
 @author_routes.route("/avatar/<int:author_id>", methods = ['POST'])
 @jwt_required()
 def upsert_author_avatar(author_id):
@@ -188,20 +439,27 @@ def upsert_author_avatar(author_id):
         )
     
       get_author = Author.query.get_or_404(author_id)
-      if file and allowed_file(file.content_type):
-        filename = secure_filename(file.filename)
-        unique_filename = f"{uuid.uuid4().hex}_{filename}"
-        file.save(os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename))
-    
-      get_author.avatar = url_for(
-        'uploaded_file',
-        filename = filename,
-        _external = True
-        )
-      db.session.add(get_author)
-      db.session.commit()
+      pending = receive_avatar(file)
+      try:
+        filename = acquire_avatar(pending)
+        previous = release_avatar(get_author.avatar)
+        get_author.avatar = url_for(
+          'uploaded_file',
+          filename = filename,
+          _external = True
+          )
+        get_author.update()
+      except Exception:
+        db.session.rollback()
+        raise
+      else:
+        place_avatar(pending, filename)
+      finally:
+        pending.discard()
+      if previous != pending.digest:
+        collect_garbage([previous])
 
-      author_schema = AuthorSchema()
+      author_schema = make_author_schema()
       author = author_schema.dump(get_author)
 
       return response_with(
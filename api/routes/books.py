@@ -1,16 +1,54 @@
 from flask import Blueprint, request
-from api.utils.responses import response_with
+from api.utils.responses import response_with, stream_response_with
 from api.utils import responses as resp
 from api.models.books import Book, BookSchema
 from api.models.authors import Author
-from api.utils.database import db
-from datetime import datetime,timezone
+from api.utils.database import db, replica_reads, primary_reads
+from api.utils.filters import ListQuery, Filter, Sort, InvalidFilter
+from api.utils.pagination import page_args, keyset_paginate, order_by, InvalidPageRequest
+from api.utils.streaming import stream_requested, dump_chunks
+from api.utils.serializers import dump
+from api.utils.conditional import (
+  make_etag, latest, not_modified, precondition_failed, set_validators, entry_response
+)
+from api.utils.cache import cache
+from api.utils.search import search_index
+from api.utils.bulk import bulk_payload, bulk_ids, load_items, insert_rows, InvalidBulkRequest
+from sqlalchemy import select, delete
 from sqlalchemy.orm.exc import StaleDataError
+from flask_jwt_extended import jwt_required
 import logging
+import operator
 
 logger = logging.getLogger(__name__)
 book_routes = Blueprint("book_routes", __name__)
 
+# Year filters and sorting are only served by (author_id, year), so they
+# need an author_id to avoid scanning the whole table.
+book_list_query = ListQuery(
+  filters={
+    'author_id': Filter(Book.author_id, operator.eq, int),
+    'year_from': Filter(Book.year, operator.ge, int, requires='author_id'),
+    'year_to': Filter(Book.year, operator.le, int, requires='author_id'),
+  },
+  sorts={
+    'id': Sort(Book.id),
+    'year': Sort(Book.year, Book.id, requires='author_id'),
+  },
+  default_sort='id'
+)
+
+def book_key_columns(columns=()):
+  return list(columns) + [c for c in (Book.id, Book.updated_at, Book.version)
+                         if c not in columns]
+
+def book_keys(query, columns=()):
+  return query.with_entities(*book_key_columns(columns))
+
+def book_validators(keys, *extra):
+  etag = make_etag('books', [tuple(key) for key in keys], *extra)
+  return etag, latest([key.updated_at for key in keys])
+
 @book_routes.route("/", methods = ['POST'])
 def create_book():
   try:
@@ -41,21 +79,116 @@ def create_book():
     logger.error(f"Error while creating book: {str(e)}")
     return response_with(resp.INVALID_INPUT_422)
   
+@book_routes.route("/bulk", methods = ['POST'])
+def create_books_bulk():
+  try:
+    data = bulk_payload()
+    book_schema = BookSchema(transient=True)
+    books, errors = load_items(book_schema, data)
+
+    # One query for every referenced author instead of one per book.
+    author_ids = {book.author_id for book in books.values()}
+    existing = {
+      row.id for row in
+      db.session.query(Author.id).filter(Author.id.in_(author_ids))
+    } if author_ids else set()
+
+    for index, book in list(books.items()):
+      if book.author_id not in existing:
+        errors[str(index)] = {
+          'author_id': [f"Author with id {book.author_id} not found"]
+        }
+        del books[index]
+
+    if not books:
+      return response_with(resp.INVALID_INPUT_422, error=errors)
+
+    insert_rows(Book, [
+      {'title': book.title, 'year': book.year, 'author_id': book.author_id}
+      for book in books.values()
+    ])
+    db.session.commit()
+    cache.invalidate('author', *{book.author_id for book in books.values()})
+    search_index.catch_up('book')
+
+    return response_with(
+      resp.SUCCESS_201,
+      value={"created": len(books)},
+      error=errors or None
+    )
+
+  except InvalidBulkRequest as e:
+    return response_with(resp.BAD_REQUEST_400, message=str(e))
+  except Exception as e:
+    db.session.rollback()
+    logger.error(f"Error while bulk creating books: {str(e)}")
+    return response_with(resp.INVALID_INPUT_422)
+
 @book_routes.route("/", methods = ['GET'])
+@replica_reads
 def get_all_books():
-  books = Book.query.all()
-  book_schema = BookSchema(many=True)
-
-  result = book_schema.dump(books)
-  return response_with(
-    resp.SUCCESS_200,
-    value={"books": result}
-  )
+  try:
+    book_schema = BookSchema(many=True)
+    query, columns, descending = book_list_query.apply(Book.query)
+
+    if stream_requested():
+      return stream_response_with(
+        resp.SUCCESS_200,
+        "books",
+        dump_chunks(query, columns, book_schema, descending=descending)
+      )
+
+    limit, cursor = page_args()
+    keys, pagination = keyset_paginate(
+      book_keys(query, columns), columns, limit, cursor, descending
+    )
+    etag, last_modified = book_validators(keys, pagination['next_cursor'])
+    cached = not_modified(etag, last_modified)
+    if cached:
+      return cached
+
+    books = Book.query.filter(Book.id.in_([key.id for key in keys]))\
+                      .order_by(*order_by(columns, descending)).all()
+    result = dump(book_schema, books)
+    return set_validators(
+      response_with(
+        resp.SUCCESS_200,
+        value={"books": result},
+        pagination=pagination
+      ),
+      etag,
+      last_modified
+    )
+
+  except (InvalidPageRequest, InvalidFilter) as e:
+    return response_with(resp.BAD_REQUEST_400, message=str(e))
+  except Exception as e:
+    logger.error(f"Error while fetching books: {str(e)}")
+    return response_with(resp.SERVER_ERROR_500)
   
 
 @book_routes.route("/<int:id>", methods = ["GET"])
+@replica_reads
 def get_book_by_id(id):
   try:
+    entry = cache.get('book', id, 'book')
+    if entry is not None:
+      return entry_response("book", entry, 'HIT')
+
+    generation = cache.generation('book', id)
+    primary_reads()
+    keys = book_keys(Book.query).filter(Book.id == id).all()
+    if not keys:
+      return response_with(
+        resp.SERVER_ERROR_404,
+        message=f"Book with id {id} not found!"
+        )
+
+    etag, last_modified = book_validators(keys)
+    cached = not_modified(etag, last_modified)
+    if cached:
+      return cached
+
     # book = Book.query.get_or_404(id)
     book = db.session.get(Book, id)
     if not book:
@@ -63,11 +196,12 @@ def get_book_by_id(id):
         resp.SERVER_ERROR_404,
         message=f"Book with id {id} not found!"
         )
-    
-    book_schema = BookSchema()
-    result = book_schema.dump(book)
 
-    return response_with(resp.SUCCESS_200, value={"book": result})
+    book_schema = BookSchema()
+    entry = cache.store(
+      'book', id, 'book', generation, dump(book_schema, book), etag, last_modified
+    )
+    return entry_response("book", entry, 'MISS')
   
   except Exception as e:
     logger.error(f"Error while creating book: {str(e)}")
@@ -83,20 +217,23 @@ def update_book_by_id(book_id):
         message="No input provided"
       )
   
-    book = db.session.query(Book).with_for_update().get(book_id)
+    book = db.session.get(Book, book_id)
     if not book:
       return response_with(
         resp.SERVER_ERROR_404,
         message=f"Book with id {book_id} not found"
       )
+
+    if request.if_match:
+      keys = book_keys(Book.query).filter(Book.id == book_id).all()
+      if precondition_failed(book_validators(keys)[0]):
+        db.session.rollback()
+        return response_with(resp.PRECONDITION_FAILED_412)
     
     try:
       book_schema = BookSchema(partial=True)
       updated_book = book_schema.load(data, instance=book)
-      updated_book.updated_at = datetime.now(timezone)
-
-      db.session.add(updated_book)
-      db.session.commit()
+      updated_book.update()
 
       result = book_schema.dump(updated_book)
       return response_with(
@@ -108,7 +245,7 @@ def update_book_by_id(book_id):
     except StaleDataError:
       db.session.rollback()
       return response_with(
-        resp.INVALID_INPUT_422,
+        resp.CONFLICT_409,
         message="Data was updated by another user. Please refresh and try again"
       )
     except Exception as e:
@@ -118,3 +255,43 @@ def update_book_by_id(book_id):
   except Exception as e:
     logger.error(f"Error while updating book")
     return response_with(resp.INVALID_INPUT_422)
+
+
+@book_routes.route("/", methods = ['DELETE'])
+@jwt_required()
+def delete_books_bulk():
+  try:
+    ids, _ = bulk_ids()
+    rows = db.session.execute(
+      select(Book.id, Book.author_id).where(Book.id.in_(ids))
+    ).all()
+    found = {row.id for row in rows}
+    errors = {
+      str(id): {'id': [f"Book with id {id} not found"]}
+      for id in ids if id not in found
+    }
+    if not rows:
+      return response_with(resp.INVALID_INPUT_422, error=errors)
+
+    deleted = db.session.execute(
+      delete(Book).where(Book.id.in_(found))
+                  .execution_options(synchronize_session=False)
+    ).rowcount
+    search_index.remove('book', found)
+    db.session.commit()
+
+    cache.invalidate('book', *found)
+    cache.invalidate('author', *{row.author_id for row in rows})
+
+    return response_with(
+      resp.SUCCESS_200,
+      value={"deleted": deleted},
+      error=errors or None
+    )
+
+  except InvalidBulkRequest as e:
+    return response_with(resp.BAD_REQUEST_400, message=str(e))
+  except Exception as e:
+    db.session.rollback()
+    logger.error(f"Error while bulk deleting books: {str(e)}")
+    return response_with(resp.SERVER_ERROR_500)
@@ -0,0 +1,50 @@
+from flask import Blueprint, request, current_app
+from api.utils.responses import response_with
+from api.utils import responses as resp
+from api.utils.search import search_index
+from api.models.authors import Author
+from api.models.books import Book
+from flask_jwt_extended import jwt_required
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+search_routes = Blueprint("search_routes", __name__)
+
+search_index.register('author', Author, ('first_name', 'last_name'))
+search_index.register('book', Book, ('title',))
+
+@search_routes.route("/", methods = ['GET'], strict_slashes=False)
+@jwt_required()
+def search():
+  try:
+    query = request.args.get('q', '').strip()
+    if not query:
+      return response_with(resp.BAD_REQUEST_400, message="q is required")
+
+    max_limit = current_app.config.get('SEARCH_MAX_RESULTS', 50)
+    try:
+      limit = int(request.args.get('limit', 20))
+    except ValueError:
+      return response_with(resp.BAD_REQUEST_400, message="limit must be an integer")
+    if limit < 1:
+      return response_with(resp.BAD_REQUEST_400, message="limit must be at least 1")
+    limit = min(limit, max_limit)
+
+    started = time.perf_counter()
+    results = search_index.search(query, limit)
+    took_ms = (time.perf_counter() - started) * 1000
+
+    return response_with(
+      resp.SUCCESS_200,
+      value={"results": results, "took_ms": round(took_ms, 3)}
+    )
+
+  except Exception as e:
+    logger.error(f"Error while searching: {str(e)}")
+    return response_with(resp.SERVER_ERROR_500)
+
+@search_routes.route("/stats", methods = ['GET'])
+@jwt_required()
+def search_stats():
+  return response_with(resp.SUCCESS_200, value={"index": search_index.stats()})
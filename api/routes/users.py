@@ -6,6 +6,7 @@ from api.utils.token import generate_verification_token, confirm_verification_to
 from api.utils.email import send_email
 from api.models.users import User, UserSchema
 from api.utils.database import db
+from api.utils.hashing import HashingUnavailable
 from flask_jwt_extended import create_access_token
 from marshmallow import ValidationError
 import logging
@@ -49,10 +50,13 @@ def create_user():
                 )
             html = render_template("email/verification.html", verification_email=verification_email)
             subject = "Please Verify your email"
-            #send_email(user.email, subject, html)
-            print("verification:+++++",token)
-            print("url:+++++",verification_email)
             result = user_schema.dump(user.create())
+            # The user is committed; a mail failure must not turn into an error.
+            try:
+                if not send_email(user.email, subject, html):
+                    logger.error(f"Could not queue verification email for {user.email}")
+            except Exception:
+                logger.exception(f"Could not send verification email to {user.email}")
 
             return response_with(
                 resp.SUCCESS_201,
@@ -67,6 +71,8 @@ def create_user():
                 message=f"Validation error: {e.messages}"
             )
 
+    except HashingUnavailable:
+        return response_with(resp.SERVICE_UNAVAILABLE_503)
     except Exception as e:
         logger.exception("Error while creating user")
         return response_with(
@@ -104,6 +110,10 @@ def authenticate_user():
         if User.verify_hash(data['password'], current_user.password):
             token_identity = current_user.username if current_user else data.get('email')
             access_token = create_access_token(identity = token_identity )
+            if User.needs_rehash(current_user.password):
+                # Stored with stale parameters; upgrade while we have the password.
+                current_user.password = User.generate_hash(data['password'])
+                db.session.commit()
             current_user.update_last_login()
             return response_with(
                 resp.SUCCESS_200,
@@ -112,6 +122,8 @@ def authenticate_user():
         
         else:
             return response_with(resp.UNAUTHORIZED_403)
+    except HashingUnavailable:
+        return response_with(resp.SERVICE_UNAVAILABLE_503)
     except Exception as e:
         logger.error(f"Soemthing went wrong {str(e)}")
         return response_with(resp.INVALID_INPUT_422)
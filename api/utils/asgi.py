@@ -0,0 +1,259 @@
+"""ASGI serving with native async handlers and a WSGI fallback.
+
+`ASGIApplication` wraps the Flask app. A request that matches a route
+registered with `@async_route` is handled on the event loop. The handler
+runs inside a regular Flask request context, so request parsing, JWT
+checks, error handlers and after_request hooks behave as in the WSGI app.
+The handler awaits the asyncio engines from `AsyncDatabase` for its queries:
+`read_session()` spreads reads over READ_REPLICA_BINDS like `replica_reads`
+views, `session()` stays on the primary. Every other request runs through the WSGI app on a thread pool, which
+keeps all routes available with identical responses.
+
+`unless` names a predicate, checked inside the request context before any
+request hook runs. When it returns True the request goes to the WSGI app
+instead; streamed listings use this.
+
+Needs SQLAlchemy's asyncio extension (greenlet) and an async driver:
+aiomysql for MySQL URIs, aiosqlite for SQLite.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from werkzeug.routing import Map, Rule
+from werkzeug.exceptions import HTTPException
+import asyncio
+import contextvars
+import io
+import sys
+from api.utils.database import replicas
+from api.utils.metrics import metrics
+
+_ASYNC_DRIVERS = {
+  'mysql+pymysql': 'mysql+aiomysql',
+  'mysql': 'mysql+aiomysql',
+  'sqlite': 'sqlite+aiosqlite',
+  'sqlite+pysqlite': 'sqlite+aiosqlite',
+}
+
+_async_rules = []
+
+
+def async_route(rule, methods=('GET',), unless=None):
+  """Register a coroutine as the native handler for `rule`."""
+  def decorator(handler):
+    _async_rules.append(Rule(rule, methods=list(methods), endpoint=(handler, unless)))
+    return handler
+  return decorator
+
+
+def async_database_uri(uri):
+  scheme, _, rest = uri.partition('://')
+  return f"{_ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
+
+
+class AsyncDatabase(object):
+  """asyncio engines and session factories built from the app's config."""
+
+  def __init__(self):
+    self.engine = None
+    self.session = None
+    self.replica_binds = []
+    self._replica_sessions = {}
+    self._engines = []
+
+  def init_app(self, app):
+    self._engines = []
+    uri = app.config.get('ASYNC_DATABASE_URI') or \
+      async_database_uri(app.config['SQLALCHEMY_DATABASE_URI'])
+    self.engine = self._create_engine(app, uri)
+    self.session = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    binds = app.config.get('SQLALCHEMY_BINDS') or {}
+    self.replica_binds = list(app.config.get('READ_REPLICA_BINDS', []))
+    self._replica_sessions = {}
+    for bind in self.replica_binds:
+      options = binds[bind]
+      url = options['url'] if isinstance(options, dict) else options
+      engine = self._create_engine(app, async_database_uri(str(url)))
+      event.listen(engine.sync_engine, 'handle_error', replicas._on_error(bind))
+      self._replica_sessions[bind] = async_sessionmaker(engine, expire_on_commit=False)
+
+  def _create_engine(self, app, uri):
+    options = dict(app.config.get('ASYNC_ENGINE_OPTIONS', {}))
+    if uri.startswith('sqlite'):
+      # aiosqlite gets a NullPool (StaticPool in memory); no pool to size.
+      for key in ('pool_size', 'max_overflow', 'pool_timeout'):
+        options.pop(key, None)
+    engine = create_async_engine(uri, **options)
+    if metrics.enabled:
+      metrics.instrument_pool(engine.sync_engine.pool)
+    self._engines.append(engine)
+    return engine
+
+  def read_session(self):
+    """A session on a replica not marked down, or on the primary."""
+    bind = replicas.choose_bind(self.replica_binds)
+    return self._replica_sessions[bind]() if bind is not None else self.session()
+
+  async def dispose(self):
+    for engine in self._engines:
+      await engine.dispose()
+
+
+async_db = AsyncDatabase()
+
+
+def build_environ(scope, body):
+  server = scope.get('server') or ('localhost', 80)
+  client = scope.get('client') or ('', 0)
+  environ = {
+    'REQUEST_METHOD': scope['method'],
+    'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+    'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+    'QUERY_STRING': scope['query_string'].decode('latin1'),
+    'SERVER_NAME': server[0],
+    'SERVER_PORT': str(server[1]),
+    'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+    'REMOTE_ADDR': client[0],
+    'REMOTE_PORT': str(client[1]),
+    'CONTENT_LENGTH': str(len(body)),
+    'wsgi.version': (1, 0),
+    'wsgi.url_scheme': scope.get('scheme', 'http'),
+    'wsgi.input': io.BytesIO(body),
+    'wsgi.errors': sys.stderr,
+    'wsgi.multithread': True,
+    'wsgi.multiprocess': True,
+    'wsgi.run_once': False,
+  }
+  for name, value in scope['headers']:
+    name = name.decode('latin1').upper().replace('-', '_')
+    value = value.decode('latin1')
+    if name == 'CONTENT_TYPE':
+      environ['CONTENT_TYPE'] = value
+    elif name != 'CONTENT_LENGTH':
+      key = f"HTTP_{name}"
+      environ[key] = f"{environ[key]},{value}" if key in environ else value
+  return environ
+
+
+async def read_body(receive):
+  chunks = []
+  while True:
+    message = await receive()
+    chunks.append(message.get('body', b''))
+    if not message.get('more_body', False):
+      return b''.join(chunks)
+
+
+class ASGIApplication(object):
+  def __init__(self, app, threads=None):
+    self.app = app
+    self.threads = threads or app.config.get('ASGI_WSGI_THREADS', 32)
+    self.executor = None
+    self.routes = Map(list(_async_rules))
+
+  async def __call__(self, scope, receive, send):
+    if scope['type'] == 'lifespan':
+      return await self._lifespan(receive, send)
+    if scope['type'] != 'http':
+      return
+
+    if self.executor is None:
+      # Servers that do not send lifespan events.
+      self._start()
+
+    endpoint, args = self._match(scope)
+    if endpoint is not None:
+      status, headers, body = await self._native(scope, *endpoint, args)
+      if status is not None:
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+        return
+    await self._wsgi(scope, await read_body(receive), send)
+
+  async def _lifespan(self, receive, send):
+    while True:
+      message = await receive()
+      if message['type'] == 'lifespan.startup':
+        self._start()
+        await send({'type': 'lifespan.startup.complete'})
+      elif message['type'] == 'lifespan.shutdown':
+        await async_db.dispose()
+        if self.executor is not None:
+          self.executor.shutdown(wait=False)
+        await send({'type': 'lifespan.shutdown.complete'})
+        return
+
+  def _start(self):
+    async_db.init_app(self.app)
+    self.executor = ThreadPoolExecutor(self.threads, thread_name_prefix='wsgi')
+
+  def _match(self, scope):
+    adapter = self.routes.bind('', path_info=scope['path'])
+    try:
+      return adapter.match(method=scope['method'])
+    except HTTPException:
+      return None, None
+
+  async def _native(self, scope, handler, unless, args):
+    """Run `handler` in a Flask request context.
+
+    Returns (None, None, None) when `unless` sends the request to WSGI.
+    """
+    app = self.app
+    ctx = app.request_context(build_environ(scope, b''))
+    ctx.push()
+    error = None
+    try:
+      if unless is not None and unless():
+        return None, None, None
+      try:
+        rv = app.preprocess_request()
+        if rv is None:
+          rv = await handler(**args)
+        response = app.finalize_request(rv)
+      except Exception as e:
+        response = app.finalize_request(app.handle_user_exception(e))
+    except Exception as e:
+      error = e
+      response = app.handle_exception(e)
+    finally:
+      ctx.pop(error)
+
+    body = b'' if scope['method'] == 'HEAD' else b''.join(response.iter_encoded())
+    headers = [(name.lower().encode('latin1'), value.encode('latin1'))
+               for name, value in response.headers.items()]
+    return response.status_code, headers, body
+
+  async def _wsgi(self, scope, body, send):
+    loop = asyncio.get_running_loop()
+    # Streamed responses iterate inside the request context pushed by
+    # stream_with_context; one context object keeps it visible to every
+    # pool thread that advances the iterator.
+    context = contextvars.copy_context()
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+      started['status'] = int(status.split(' ', 1)[0])
+      started['headers'] = [(name.lower().encode('latin1'), value.encode('latin1'))
+                            for name, value in headers]
+
+    def run(function, *args):
+      return loop.run_in_executor(self.executor, context.run, function, *args)
+
+    iterable = await run(self.app, build_environ(scope, body), start_response)
+    iterator = iter(iterable)
+    try:
+      await send({'type': 'http.response.start', 'status': started['status'],
+                  'headers': started['headers']})
+      while True:
+        chunk = await run(next, iterator, None)
+        if chunk is None:
+          break
+        if chunk:
+          await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+      await send({'type': 'http.response.body', 'body': b''})
+    finally:
+      close = getattr(iterable, 'close', None)
+      if close is not None:
+        await run(close)
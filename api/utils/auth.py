@@ -0,0 +1,188 @@
+"""JWT verification with cached claims and cached user status.
+
+`CachingJWTManager` keeps the claims of every verified access token in a
+bounded LRU keyed by the token's SHA-256 digest. Each entry lives until the
+token's `exp`, so a repeated token skips signature verification. Every
+protected request still resolves its identity through `load_user`, which
+keeps the active/verified status of each username for JWT_USER_CACHE_TTL
+seconds. Missing and inactive users are rejected with a 401.
+
+Both caches belong to one process, but every entry records the user's
+generation, kept in the shared resource cache backend (the `generations`
+table of the SQLite backend). Deactivating, un-verifying or deleting a user
+bumps that generation once the transaction commits, so every worker drops
+the user's entries on its next request. Call `jwt.evict_user()` when
+revoking a user by other means. A generation is read at most once per
+request. With CACHE_BACKEND 'lru' or 'null' the generations are
+per-process too.
+
+Claims are cached by overriding JWTManager._decode_jwt_from_config, the
+one method every token decode goes through. It is private, so
+flask_jwt_extended is pinned in requirements.txt; if its signature changes
+anyway, claims caching is switched off with a warning.
+"""
+from collections import namedtuple
+from flask import g, has_app_context
+from flask_jwt_extended import JWTManager
+from sqlalchemy import event, inspect, select
+from api.utils.cache import cache, LRUBackend, NullBackend
+from api.utils.database import db, RoutingSession
+from api.models.users import User
+import hashlib
+import inspect as pyinspect
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+UserStatus = namedtuple('UserStatus', 'id username is_active is_verified')
+MISSING_USER = UserStatus(None, None, False, False)
+
+_DECODE_PARAMETERS = ['self', 'encoded_token', 'csrf_value', 'allow_expired']
+
+
+def _decode_hook_matches():
+  method = getattr(JWTManager, '_decode_jwt_from_config', None)
+  return method is not None and \
+    list(pyinspect.signature(method).parameters) == _DECODE_PARAMETERS
+
+
+class CachingJWTManager(JWTManager):
+  def __init__(self, app=None, **kwargs):
+    self.claims_cache = LRUBackend(10000)
+    self.user_cache = LRUBackend(10000)
+    self.user_ttl = 30
+    self.cache_enabled = True
+    self.claims_enabled = True
+    self._local_generations = LRUBackend()
+    super().__init__(app, **kwargs)
+
+  def init_app(self, app, **kwargs):
+    super().init_app(app, **kwargs)
+    self.cache_enabled = app.config.get('JWT_CACHE_ENABLED', True)
+    max_entries = app.config.get('JWT_CACHE_MAX_ENTRIES', 10000)
+    self.claims_cache = LRUBackend(max_entries)
+    self.user_cache = LRUBackend(max_entries)
+    self.user_ttl = app.config.get('JWT_USER_CACHE_TTL', 30)
+    self.claims_enabled = _decode_hook_matches()
+    if self.cache_enabled and not self.claims_enabled:
+      logger.warning("JWTManager._decode_jwt_from_config changed; JWT claims are not cached")
+
+  def _generations(self):
+    # Resolved per call: the resource cache may be initialised after us.
+    backend = cache.backend
+    return self._local_generations if isinstance(backend, NullBackend) else backend
+
+  def generation(self, identity):
+    """The shared generation of `identity`, read once per request."""
+    if not has_app_context():
+      return self._generations().generation(f"user:{identity}")
+    known = g.setdefault('jwt_generations', {})
+    if identity not in known:
+      known[identity] = self._generations().generation(f"user:{identity}")
+    return known[identity]
+
+  def evict_user(self, username):
+    """Forget the cached claims and status of `username` in every worker."""
+    self._generations().invalidate(f"user:{username}")
+    self.user_cache.delete(username)
+    if has_app_context():
+      g.pop('jwt_generations', None)
+      g.pop('jwt_user', None)
+
+  def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+    if not (self.cache_enabled and self.claims_enabled) or csrf_value is not None \
+        or allow_expired:
+      return super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+
+    key = hashlib.sha256(encoded_token.encode()).digest()
+    entry = self.claims_cache.get(key)
+    if entry is not None:
+      claims, identity, generation, expires = entry
+      if time.time() < expires and generation == self.generation(identity):
+        return dict(claims)
+
+    claims = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+    expires = claims.get('exp')
+    if expires is not None:
+      identity = claims.get('sub')
+      ttl = expires - time.time()
+      if ttl > 0:
+        self.claims_cache.set(key, (claims, identity, self.generation(identity), expires), ttl)
+    return dict(claims)
+
+
+jwt = CachingJWTManager()
+
+
+def user_status_query(username):
+  return select(User.id, User.username, User.is_active, User.is_verified)\
+    .where(User.username == username)
+
+
+def cached_user(username):
+  """The UserStatus of `username` known without a query, or None."""
+  resolved = g.get('jwt_user')
+  if resolved is not None and resolved[0] == username:
+    return resolved[1]
+  entry = jwt.user_cache.get(username) if jwt.cache_enabled else None
+  if entry is None:
+    return None
+  status, generation = entry
+  return status if generation == jwt.generation(username) else None
+
+
+def remember_user(username, row, generation):
+  """Build the UserStatus of a `user_status_query` row and cache it.
+
+  The status (MISSING_USER when there is no row) is kept on `g` for the
+  rest of the request. `generation` is read before the query ran, so a
+  status fetched while the user was being evicted is cached under the old
+  generation and ignored from the next request on.
+  """
+  status = MISSING_USER if row is None else UserStatus(*row)
+  g.jwt_user = (username, status)
+  if row is not None and jwt.cache_enabled:
+    jwt.user_cache.set(username, (status, generation), jwt.user_ttl)
+  return status
+
+
+@jwt.user_lookup_loader
+def load_user(jwt_header, jwt_data):
+  username = jwt_data['sub']
+  status = cached_user(username)
+  if status is None:
+    generation = jwt.generation(username)
+    row = db.session.execute(user_status_query(username)).first()
+    status = remember_user(username, row, generation)
+  return status if status.is_active else None
+
+
+def _pending_evictions(session):
+  return session.info.setdefault('jwt_evictions', set())
+
+
+@event.listens_for(User, 'after_update')
+def _user_updated(mapper, connection, target):
+  state = inspect(target)
+  if any(state.attrs[name].history.has_changes()
+         for name in ('username', 'is_active', 'is_verified')):
+    evictions = _pending_evictions(state.session)
+    evictions.add(target.username)
+    evictions.update(state.attrs.username.history.deleted or ())
+
+
+@event.listens_for(User, 'after_delete')
+def _user_deleted(mapper, connection, target):
+  _pending_evictions(inspect(target).session).add(target.username)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _evict_users(session):
+  for username in session.info.pop('jwt_evictions', ()):
+    jwt.evict_user(username)
+
+
+@event.listens_for(RoutingSession, 'after_soft_rollback')
+def _discard_evictions(session, previous_transaction):
+  session.info.pop('jwt_evictions', None)
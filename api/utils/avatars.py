@@ -0,0 +1,260 @@
+"""Content-addressed, reference-counted avatar storage.
+
+Uploads are streamed to a temporary file while being hashed, then stored as
+`<UPLOAD_FOLDER>/<d[:2]>/<d[2:4]>/<digest>.<ext>`; identical images share
+one file. `avatar_blobs.ref_count` counts the authors pointing at each file
+and a blob whose count drops to zero is garbage collected.
+
+Acquiring a blob updates its row in the caller's transaction; the file
+stays in `.tmp` until that transaction commits and is only then moved into
+place, so a failed update never leaves a file without a row. The collector
+locks the row before unlinking, so a concurrent upload of the same image
+can never lose its file.
+
+`send_avatar` serves blobs with an immutable Cache-Control and their digest
+as a strong ETag, or hands the transfer to the front proxy.
+"""
+from flask import current_app, request, abort
+from werkzeug.security import safe_join
+from werkzeug.utils import send_from_directory
+from sqlalchemy import update, delete, select, case
+from sqlalchemy.exc import IntegrityError
+from api.utils.database import db
+from api.models.avatars import AvatarBlob
+from collections import Counter
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+EXTENSIONS = {'image/jpeg': 'jpg', 'jpeg': 'jpg', 'image/png': 'png'}
+
+_BLOB_NAME = re.compile(r"^([0-9a-f]{64})\.([a-z0-9]+)$")
+
+
+def blob_path(filename):
+  """Path of `filename` relative to UPLOAD_FOLDER (legacy names are flat)."""
+  if _BLOB_NAME.match(filename):
+    return os.path.join(filename[:2], filename[2:4], filename)
+  return filename
+
+
+def digest_from_url(url):
+  if not url:
+    return None
+  match = _BLOB_NAME.match(url.rsplit('/', 1)[-1])
+  return match.group(1) if match else None
+
+
+class PendingAvatar(object):
+  def __init__(self, path, digest, extension, size):
+    self.path = path
+    self.digest = digest
+    self.extension = extension
+    self.size = size
+
+  @property
+  def filename(self):
+    return f"{self.digest}.{self.extension}"
+
+  def discard(self):
+    if self.path and os.path.exists(self.path):
+      os.unlink(self.path)
+    self.path = None
+
+
+def upload_folder():
+  # Relative folders resolve against the app root, as send_from_directory does.
+  return os.path.join(current_app.root_path, current_app.config['UPLOAD_FOLDER'])
+
+
+def _tmp_folder():
+  folder = os.path.join(upload_folder(), '.tmp')
+  os.makedirs(folder, exist_ok=True)
+  return folder
+
+
+def receive_avatar(file):
+  """Stream an uploaded file to disk in chunks while hashing it."""
+  sha256 = hashlib.sha256()
+  size = 0
+  with tempfile.NamedTemporaryFile(dir=_tmp_folder(), delete=False) as tmp:
+    try:
+      while True:
+        chunk = file.stream.read(CHUNK_SIZE)
+        if not chunk:
+          break
+        sha256.update(chunk)
+        tmp.write(chunk)
+        size += len(chunk)
+    except Exception:
+      os.unlink(tmp.name)
+      raise
+  return PendingAvatar(tmp.name, sha256.hexdigest(), EXTENSIONS[file.content_type], size)
+
+
+def acquire_avatar(pending):
+  """Take a reference on `pending`'s blob; returns its filename.
+
+  Runs in the caller's transaction. The caller commits, then calls
+  `place_avatar`.
+  """
+  result = db.session.execute(
+    update(AvatarBlob)
+    .where(AvatarBlob.digest == pending.digest)
+    .values(ref_count=AvatarBlob.ref_count + 1)
+  )
+  if result.rowcount == 0:
+    try:
+      with db.session.begin_nested():
+        db.session.add(AvatarBlob(
+          digest=pending.digest,
+          extension=pending.extension,
+          size=pending.size,
+          ref_count=1
+        ))
+    except IntegrityError:
+      # Another upload created the row first.
+      db.session.execute(
+        update(AvatarBlob)
+        .where(AvatarBlob.digest == pending.digest)
+        .values(ref_count=AvatarBlob.ref_count + 1)
+      )
+    extension = pending.extension
+  else:
+    extension = db.session.execute(
+      select(AvatarBlob.extension).where(AvatarBlob.digest == pending.digest)
+    ).scalar_one()
+  return f"{pending.digest}.{extension}"
+
+
+def place_avatar(pending, filename):
+  """Move `pending` to the blob path of `filename` once its row is committed."""
+  path = os.path.join(upload_folder(), blob_path(filename))
+  if os.path.exists(path):
+    pending.discard()
+  else:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(pending.path, path)
+    pending.path = None
+
+
+def release_avatar(url):
+  """Drop one reference on the blob behind `url`; returns its digest."""
+  digest = digest_from_url(url)
+  if digest is not None:
+    db.session.execute(
+      update(AvatarBlob)
+      .where(AvatarBlob.digest == digest, AvatarBlob.ref_count > 0)
+      .values(ref_count=AvatarBlob.ref_count - 1)
+    )
+  return digest
+
+
+def release_avatars(urls):
+  """Drop one reference per url, with one UPDATE per distinct blob.
+
+  Returns the digests released.
+  """
+  counts = Counter(digest for digest in map(digest_from_url, urls) if digest)
+  for digest, count in counts.items():
+    db.session.execute(
+      update(AvatarBlob)
+      .where(AvatarBlob.digest == digest)
+      .values(ref_count=case(
+        (AvatarBlob.ref_count > count, AvatarBlob.ref_count - count), else_=0
+      ))
+    )
+  return list(counts)
+
+
+def collect_garbage(digests=None, tmp_max_age=3600):
+  """Delete unreferenced blobs (all of them, or only `digests`).
+
+  Returns the number of files removed.
+  """
+  query = select(AvatarBlob.digest).where(AvatarBlob.ref_count <= 0)
+  if digests is not None:
+    digests = [digest for digest in digests if digest]
+    if not digests:
+      return 0
+    query = query.where(AvatarBlob.digest.in_(digests))
+
+  removed = 0
+  folder = upload_folder()
+  for digest in db.session.execute(query).scalars().all():
+    try:
+      blob = db.session.execute(
+        select(AvatarBlob)
+        .where(AvatarBlob.digest == digest, AvatarBlob.ref_count <= 0)
+        .with_for_update()
+      ).scalar_one_or_none()
+      if blob is not None:
+        path = os.path.join(folder, blob_path(blob.filename))
+        if os.path.exists(path):
+          os.unlink(path)
+        db.session.execute(delete(AvatarBlob).where(AvatarBlob.digest == digest))
+        removed += 1
+      db.session.commit()
+    except Exception as e:
+      db.session.rollback()
+      logger.error(f"Failed to collect avatar {digest}: {str(e)}")
+
+  if digests is None:
+    cutoff = time.time() - tmp_max_age
+    for entry in os.scandir(_tmp_folder()):
+      if entry.is_file() and entry.stat().st_mtime < cutoff:
+        os.unlink(entry.path)
+
+  return removed
+
+
+def send_avatar(filename):
+  """Serve an avatar, with Range and conditional request support.
+
+  With AVATAR_SENDFILE set the response carries no body and the front
+  proxy streams the file: 'x-accel-redirect' points nginx at the internal
+  AVATAR_ACCEL_PREFIX location, 'x-sendfile' sends the absolute path.
+  """
+  config = current_app.config
+  folder = upload_folder()
+  path = blob_path(filename)
+  digest = digest_from_url(filename)
+  mode = config.get('AVATAR_SENDFILE')
+
+  if mode == 'x-accel-redirect':
+    if safe_join(folder, path) is None or not os.path.isfile(os.path.join(folder, path)):
+      abort(404)
+    response = current_app.response_class(
+      mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    )
+    response.headers['X-Accel-Redirect'] = config['AVATAR_ACCEL_PREFIX'].rstrip('/') + '/' + path
+    if digest is not None:
+      response.set_etag(digest)
+      response.cache_control.public = True
+      response.cache_control.max_age = config['AVATAR_MAX_AGE']
+      response.cache_control.immutable = True
+      if request.if_none_match.contains(digest):
+        response.headers.pop('X-Accel-Redirect')
+        response.status_code = 304
+    return response
+
+  response = send_from_directory(
+    folder,
+    path,
+    request.environ,
+    conditional=True,
+    etag=digest or True,
+    max_age=config['AVATAR_MAX_AGE'] if digest else None,
+    use_x_sendfile=mode == 'x-sendfile',
+    response_class=current_app.response_class,
+  )
+  if digest is not None:
+    response.cache_control.immutable = True
+  return response
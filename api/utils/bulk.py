@@ -0,0 +1,69 @@
+from flask import request, current_app
+from marshmallow import ValidationError
+from sqlalchemy import insert
+from api.utils.database import db
+
+
+class InvalidBulkRequest(ValueError):
+  pass
+
+
+def bulk_payload():
+  """Return the JSON array posted to a bulk endpoint."""
+  data = request.get_json(silent=True)
+  if not isinstance(data, list) or not data:
+    raise InvalidBulkRequest("A non-empty JSON array is required")
+
+  max_items = current_app.config.get('BULK_MAX_ITEMS', 10000)
+  if len(data) > max_items:
+    raise InvalidBulkRequest(f"At most {max_items} items can be sent at once")
+  return data
+
+
+def bulk_ids():
+  """Return the distinct ids of a bulk delete request and its JSON body.
+
+  The body is an object with an `ids` array of integers.
+  """
+  data = request.get_json(silent=True)
+  if not isinstance(data, dict):
+    raise InvalidBulkRequest("A JSON object with an ids array is required")
+
+  ids = data.get('ids')
+  if not isinstance(ids, list) or not ids:
+    raise InvalidBulkRequest("ids must be a non-empty array")
+  if not all(isinstance(id, int) and not isinstance(id, bool) for id in ids):
+    raise InvalidBulkRequest("ids must be integers")
+
+  max_items = current_app.config.get('BULK_MAX_ITEMS', 10000)
+  if len(ids) > max_items:
+    raise InvalidBulkRequest(f"At most {max_items} items can be sent at once")
+  return list(dict.fromkeys(ids)), data
+
+
+def load_items(schema, items):
+  """Validate every item in one pass.
+
+  Returns the loaded (transient) instances keyed by their position in the
+  request, and the per-item error messages.
+  """
+  loaded = {}
+  errors = {}
+  for index, item in enumerate(items):
+    if not isinstance(item, dict):
+      errors[str(index)] = {'_schema': ["Invalid input type."]}
+      continue
+    try:
+      loaded[index] = schema.load(item)
+    except ValidationError as e:
+      errors[str(index)] = e.messages
+    except ValueError as e:
+      # Raised by the model level @validates hooks.
+      errors[str(index)] = {'_schema': [str(e)]}
+  return loaded, errors
+
+
+def insert_rows(model, rows):
+  """Insert `rows` with a single executemany in the current transaction."""
+  if rows:
+    db.session.execute(insert(model), rows)
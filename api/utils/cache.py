@@ -0,0 +1,256 @@
+"""Read-through cache for serialized author and book payloads.
+
+Entries are keyed per resource (`author:1`) and hold one payload per
+representation variant, so invalidating a resource drops every variant at
+once. Backends:
+
+* ``lru``    - in-process LRU with TTL; invalidation is per process, so
+               only for single-process serving.
+* ``sqlite`` - a SQLite file shared by every worker on the host.
+* ``null``   - caching disabled.
+
+Every invalidation also bumps a per-resource generation. A reader takes the
+generation before querying the database and passes it to `set`, which is
+skipped if the resource was invalidated in between; otherwise a write that
+commits while a GET is still building its entry would be undone by that GET.
+"""
+from datetime import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from api.utils.metrics import metrics
+
+
+class NullBackend(object):
+  def get(self, key):
+    return None
+
+  def set(self, key, value, ttl, generation=None):
+    return False
+
+  def delete(self, key):
+    pass
+
+  def generation(self, key):
+    return 0
+
+  def invalidate(self, key):
+    pass
+
+  def __len__(self):
+    return 0
+
+
+class LRUBackend(object):
+  def __init__(self, max_entries=10000):
+    self.max_entries = max_entries
+    self._data = OrderedDict()
+    self._generations = {}
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    with self._lock:
+      item = self._data.get(key)
+      if item is None:
+        return None
+      value, expires = item
+      if expires < time.monotonic():
+        del self._data[key]
+        return None
+      self._data.move_to_end(key)
+      return value
+
+  def set(self, key, value, ttl, generation=None):
+    with self._lock:
+      if generation is not None and generation != self._generations.get(key, 0):
+        return False
+      self._data[key] = (value, time.monotonic() + ttl)
+      self._data.move_to_end(key)
+      while len(self._data) > self.max_entries:
+        self._data.popitem(last=False)
+      return True
+
+  def delete(self, key):
+    with self._lock:
+      self._data.pop(key, None)
+
+  def generation(self, key):
+    return self._generations.get(key, 0)
+
+  def invalidate(self, key):
+    with self._lock:
+      self._generations[key] = self._generations.get(key, 0) + 1
+      self._data.pop(key, None)
+
+  def __len__(self):
+    return len(self._data)
+
+
+class SQLiteBackend(object):
+  PURGE_EVERY = 1000
+
+  def __init__(self, path, max_entries=100000):
+    self.path = path
+    self.max_entries = max_entries
+    self._local = threading.local()
+    self._writes = 0
+    connection = self._connection()
+    connection.execute(
+      "CREATE TABLE IF NOT EXISTS cache "
+      "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+    )
+    # Never purged: one small row per resource ever invalidated.
+    connection.execute(
+      "CREATE TABLE IF NOT EXISTS generations "
+      "(key TEXT PRIMARY KEY, generation INTEGER NOT NULL)"
+    )
+
+  def _connection(self):
+    # Connections must not cross a fork, so they are tracked per pid too.
+    connection = getattr(self._local, 'connection', None)
+    if connection is None or self._local.pid != os.getpid():
+      connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+      connection.execute("PRAGMA journal_mode=WAL")
+      connection.execute("PRAGMA synchronous=NORMAL")
+      self._local.connection = connection
+      self._local.pid = os.getpid()
+    return connection
+
+  def get(self, key):
+    row = self._connection().execute(
+      "SELECT value FROM cache WHERE key = ? AND expires >= ?", (key, time.time())
+    ).fetchone()
+    return json.loads(row[0]) if row else None
+
+  def _generation(self, connection, key):
+    row = connection.execute(
+      "SELECT generation FROM generations WHERE key = ?", (key,)
+    ).fetchone()
+    return row[0] if row else 0
+
+  def set(self, key, value, ttl, generation=None):
+    connection = self._connection()
+    data = json.dumps(value, separators=(',', ':'))
+    with connection:
+      connection.execute("BEGIN IMMEDIATE")
+      if generation is not None and generation != self._generation(connection, key):
+        return False
+      connection.execute(
+        "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+        (key, data, time.time() + ttl)
+      )
+    self._writes += 1
+    if self._writes % self.PURGE_EVERY == 0:
+      self._purge(connection)
+    return True
+
+  def _purge(self, connection):
+    connection.execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
+    connection.execute(
+      "DELETE FROM cache WHERE key IN "
+      "(SELECT key FROM cache ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+      (self.max_entries,)
+    )
+
+  def delete(self, key):
+    self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+  def generation(self, key):
+    return self._generation(self._connection(), key)
+
+  def invalidate(self, key):
+    connection = self._connection()
+    with connection:
+      connection.execute("BEGIN IMMEDIATE")
+      connection.execute(
+        "INSERT INTO generations (key, generation) VALUES (?, 1) "
+        "ON CONFLICT (key) DO UPDATE SET generation = generation + 1",
+        (key,)
+      )
+      connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+  def __len__(self):
+    return self._connection().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class ResourceCache(object):
+  def __init__(self, app=None):
+    self.backend = NullBackend()
+    self.ttl = 0
+    self.hits = 0
+    self.misses = 0
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    name = app.config.get('CACHE_BACKEND', 'sqlite')
+    max_entries = app.config.get('CACHE_MAX_ENTRIES', 10000)
+    if name == 'lru':
+      self.backend = LRUBackend(max_entries)
+    elif name == 'sqlite':
+      path = app.config.get('CACHE_PATH')
+      if not path:
+        os.makedirs(app.instance_path, exist_ok=True)
+        path = os.path.join(app.instance_path, 'resource-cache.sqlite3')
+      self.backend = SQLiteBackend(path, max_entries)
+    elif name in (None, 'null'):
+      self.backend = NullBackend()
+    else:
+      raise ValueError(f"Unknown CACHE_BACKEND {name!r}")
+    self.ttl = app.config.get('CACHE_DEFAULT_TTL', 300)
+    app.extensions['resource_cache'] = self
+
+  def get(self, kind, id, variant):
+    entry = (self.backend.get(f"{kind}:{id}") or {}).get(variant)
+    if entry is None:
+      self.misses += 1
+      metrics.inc('cache_requests_total', kind=kind, result='miss')
+      return None
+    self.hits += 1
+    metrics.inc('cache_requests_total', kind=kind, result='hit')
+    # Entries are stored as plain JSON, so the timestamp is an ISO string.
+    last_modified = entry['last_modified']
+    if last_modified is not None:
+      last_modified = datetime.fromisoformat(last_modified)
+    return {**entry, 'last_modified': last_modified}
+
+  def generation(self, kind, id):
+    """Read before loading the resource; pass the result to `set`."""
+    return self.backend.generation(f"{kind}:{id}")
+
+  def set(self, kind, id, variant, entry, generation=None):
+    """Store `entry`, unless the resource was invalidated since `generation`."""
+    key = f"{kind}:{id}"
+    last_modified = entry['last_modified']
+    entry = {
+      **entry,
+      'last_modified': None if last_modified is None else last_modified.isoformat(),
+    }
+    variants = dict(self.backend.get(key) or {})
+    variants[variant] = entry
+    return self.backend.set(key, variants, self.ttl, generation)
+
+  def store(self, kind, id, variant, generation, payload, etag, last_modified):
+    """Build the entry for a freshly loaded payload, `set` it and return it."""
+    entry = {'payload': payload, 'etag': etag, 'last_modified': last_modified}
+    self.set(kind, id, variant, entry, generation)
+    return entry
+
+  def invalidate(self, kind, *ids):
+    for id in ids:
+      if id is not None:
+        self.backend.invalidate(f"{kind}:{id}")
+
+  def stats(self):
+    return {
+      'backend': type(self.backend).__name__,
+      'entries': len(self.backend),
+      'hits': self.hits,
+      'misses': self.misses,
+    }
+
+
+cache = ResourceCache()
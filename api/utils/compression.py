@@ -0,0 +1,90 @@
+"""gzip compression negotiated through Accept-Encoding.
+
+Responses of a COMPRESS_MIMETYPES type are compressed at COMPRESS_LEVEL.
+Buffered bodies are only compressed when they hold at least
+COMPRESS_MIN_SIZE bytes. Streamed bodies are compressed chunk by chunk,
+with a sync flush after each chunk, so nothing is buffered and the client
+can decode every chunk on arrival. The following are left alone:
+- images and other types outside the whitelist;
+- file responses (direct_passthrough), X-Accel-Redirect and X-Sendfile
+  responses;
+- partial content;
+- responses that already carry a Content-Encoding.
+A compressed response keeps a strong ETag of its own, the identity tag
+with GZIP_ETAG_SUFFIX appended, because its bytes differ from the identity
+representation. conditional.py strips the suffix when comparing.
+"""
+from flask import request
+import gzip
+import zlib
+
+GZIP_ETAG_SUFFIX = '-gzip'
+
+
+class Compressor(object):
+  def __init__(self):
+    self.enabled = False
+    self.min_size = 1024
+    self.level = 6
+    self.mimetypes = frozenset()
+
+  def init_app(self, app):
+    self.enabled = app.config.get('COMPRESS_ENABLED', False)
+    if not self.enabled:
+      return
+    self.min_size = app.config.get('COMPRESS_MIN_SIZE', 1024)
+    self.level = app.config.get('COMPRESS_LEVEL', 6)
+    self.mimetypes = frozenset(app.config.get('COMPRESS_MIMETYPES', ('application/json',)))
+    app.after_request(self.compress)
+    app.extensions['compressor'] = self
+
+  def _skip(self, response):
+    return (
+      response.status_code < 200
+      or response.status_code in (204, 206, 304)
+      or response.direct_passthrough
+      or 'Content-Encoding' in response.headers
+      or 'X-Accel-Redirect' in response.headers
+      or 'X-Sendfile' in response.headers
+    )
+
+  def compress(self, response):
+    if response.mimetype not in self.mimetypes or self._skip(response):
+      return response
+
+    response.vary.add('Accept-Encoding')
+    if request.accept_encodings['gzip'] <= 0:
+      return response
+
+    if response.is_streamed:
+      response.response = self._stream(response.response)
+      response.headers.pop('Content-Length', None)
+    else:
+      data = response.get_data()
+      if len(data) < self.min_size:
+        return response
+      response.set_data(gzip.compress(data, self.level, mtime=0))
+
+    response.headers['Content-Encoding'] = 'gzip'
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+      response.set_etag(etag + GZIP_ETAG_SUFFIX)
+    return response
+
+  def _stream(self, chunks):
+    # wbits 16 + MAX_WBITS writes a gzip header and trailer.
+    compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    try:
+      for chunk in chunks:
+        if isinstance(chunk, str):
+          chunk = chunk.encode()
+        if chunk:
+          yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+      yield compressor.flush()
+    finally:
+      close = getattr(chunks, 'close', None)
+      if close is not None:
+        close()
+
+
+compressor = Compressor()
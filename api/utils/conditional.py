@@ -0,0 +1,91 @@
+import hashlib
+from datetime import timezone
+from flask import request, current_app
+from api.utils.responses import response_with
+from api.utils.compression import GZIP_ETAG_SUFFIX
+from api.utils import responses as resp
+
+
+def make_etag(*parts):
+  """Strong validator for a representation built from `parts`."""
+  return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def as_utc(value):
+  # Timestamps are written as UTC but come back naive from MySQL/SQLite.
+  if value is not None and value.tzinfo is None:
+    return value.replace(tzinfo=timezone.utc)
+  return value
+
+
+def latest(values):
+  values = [value for value in values if value is not None]
+  return max(values) if values else None
+
+
+def set_validators(response, etag, last_modified=None):
+  response.set_etag(etag)
+  if last_modified is not None:
+    response.last_modified = as_utc(last_modified)
+  return response
+
+
+def matching_tag(etags, etag, weak=False):
+  """The tag in `etags` naming `etag` in any content coding, or None.
+
+  Compressed responses carry `etag` with a coding suffix; see compression.py.
+  """
+  contains = etags.contains_weak if weak else etags.contains
+  for tag in (etag, etag + GZIP_ETAG_SUFFIX):
+    if contains(tag):
+      return tag
+  return None
+
+
+def precondition_failed(*etags):
+  """True if the request has an If-Match that matches none of `etags`."""
+  if not request.if_match:
+    return False
+  return not any(matching_tag(request.if_match, etag) for etag in etags)
+
+
+def not_modified(etag, last_modified=None):
+  """Return a 304 response if the request's validators still match.
+
+  If-None-Match takes precedence over If-Modified-Since (RFC 7232 6).
+  The 304 repeats the matched tag, so a client holding the compressed
+  representation keeps its coding's tag.
+  """
+  if request.if_none_match:
+    etag = matching_tag(request.if_none_match, etag, weak=True)
+    if etag is None:
+      return None
+  elif request.if_modified_since and last_modified is not None:
+    modified = as_utc(last_modified).replace(microsecond=0)
+    if modified > request.if_modified_since:
+      return None
+  else:
+    return None
+
+  response = current_app.response_class(status=304)
+  return set_validators(response, etag, last_modified)
+
+
+def entry_response(name, entry, cache_status):
+  """Answer a detail GET from a `ResourceCache` entry.
+
+  A 304 if the request's validators match, otherwise a 200 with
+  `{name: payload}` and an X-Cache header of `cache_status`.
+  """
+  cached = not_modified(entry['etag'], entry['last_modified'])
+  if cached:
+    return cached
+  return set_validators(
+    response_with(
+      resp.SUCCESS_200,
+      value={name: entry['payload']},
+      headers={'X-Cache': cache_status}
+    ),
+    entry['etag'],
+    entry['last_modified']
+  )
@@ -1,3 +1,146 @@
+from flask import g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from functools import wraps
+from itertools import count
+from sqlalchemy import event, select, Select
+import logging
+import threading
+import time
 
-db = SQLAlchemy()
\ No newline at end of file
+logger = logging.getLogger(__name__)
+
+
+class ReplicaRouter(object):
+  """Round-robins reads over READ_REPLICA_BINDS, skipping unhealthy ones.
+
+  A replica is pinged at most once per REPLICA_HEALTH_CHECK_INTERVAL
+  seconds; one that fails the ping, or drops a connection mid-query, is
+  skipped for the next interval. With no healthy replica, reads fall back
+  to the primary.
+  """
+
+  def __init__(self):
+    self.binds = []
+    self.interval = 10
+    self._checked = {}
+    self._down_until = {}
+    self._next = count()
+    self._lock = threading.Lock()
+
+  def init_app(self, app):
+    self.binds = list(app.config.get('READ_REPLICA_BINDS', []))
+    self.interval = app.config.get('REPLICA_HEALTH_CHECK_INTERVAL', 10)
+    with app.app_context():
+      for bind in self.binds:
+        event.listen(db.engines[bind], 'handle_error', self._on_error(bind))
+
+  def _on_error(self, bind):
+    def handle_error(context):
+      if context.is_disconnect:
+        self.mark_down(bind)
+    return handle_error
+
+  def mark_down(self, bind):
+    logger.warning(f"Read replica {bind} marked unhealthy")
+    self._down_until[bind] = time.monotonic() + self.interval
+
+  def _healthy(self, bind):
+    now = time.monotonic()
+    if self._down_until.get(bind, 0) > now:
+      return False
+    if self._checked.get(bind, 0) + self.interval > now:
+      return True
+
+    with self._lock:
+      if self._checked.get(bind, 0) + self.interval > now:
+        return True
+      self._checked[bind] = now
+      try:
+        with db.engines[bind].connect() as connection:
+          connection.execute(select(1))
+        return True
+      except Exception as e:
+        logger.warning(f"Read replica {bind} failed health check: {str(e)}")
+        self.mark_down(bind)
+        return False
+
+  def choose_bind(self, binds):
+    """Round-robin over `binds` not marked down, without a health ping.
+
+    For the event loop, which must not block on a ping; the ASGI engines
+    report disconnects through `mark_down` like the sync ones.
+    """
+    if not binds:
+      return None
+    start = next(self._next)
+    now = time.monotonic()
+    for offset in range(len(binds)):
+      bind = binds[(start + offset) % len(binds)]
+      if self._down_until.get(bind, 0) <= now:
+        return bind
+    return None
+
+  def choose(self):
+    if not self.binds:
+      return None
+    start = next(self._next)
+    for offset in range(len(self.binds)):
+      bind = self.binds[(start + offset) % len(self.binds)]
+      if self._healthy(bind):
+        return db.engines[bind]
+    return None
+
+
+class RoutingSession(Session):
+  """Sends plain SELECTs from `replica_reads` views to a read replica.
+
+  Writes, flushes, SELECT ... FOR UPDATE and every statement issued after
+  this session has flushed stay on the primary.
+  """
+
+  def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+    if (bind is None
+        and not self._flushing
+        and not self.info.get('wrote')
+        and isinstance(clause, Select)
+        and clause._for_update_arg is None
+        and has_app_context()
+        and g.get('use_replica')):
+      engine = replicas.choose()
+      if engine is not None:
+        return engine
+    return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _stick_to_primary(session, flush_context):
+  # Read-your-writes: replicas may lag behind what this request just wrote,
+  # so the session stays on the primary until it is discarded.
+  session.info['wrote'] = True
+
+
+def replica_reads(view):
+  """Route a read-only view's SELECTs to a replica.
+
+  Not for views that read and then write: the check would run against the
+  replica's lag, not the row being written.
+  """
+  @wraps(view)
+  def wrapper(*args, **kwargs):
+    g.use_replica = True
+    return view(*args, **kwargs)
+  return wrapper
+
+
+def primary_reads():
+  """Send the rest of this request's reads to the primary.
+
+  For results that outlive the request, such as read-through cache
+  entries: a lagging replica's row would be served long after it caught up.
+  """
+  g.use_replica = False
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+replicas = ReplicaRouter()
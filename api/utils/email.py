@@ -1,13 +1,142 @@
 from flask_mail import Mail, Message
 from flask import current_app
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
 
 mail = Mail()
 
+_STOP = object()
+
+
+class MailQueue(object):
+  """Delivers messages from a bounded queue on background worker threads.
+
+  Each worker keeps one SMTP connection open and reuses it for every message
+  it sends, closing it after MAIL_CONNECTION_IDLE_TIMEOUT seconds without
+  work. Failed sends are retried with exponential backoff on a fresh
+  connection.
+  """
+
+  def __init__(self, app=None):
+    self.app = None
+    self._queue = None
+    self._workers = []
+    self._pid = None
+    self._lock = threading.Lock()
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    self.app = app
+    self.workers = app.config.get('MAIL_WORKERS', 2)
+    self.max_retries = app.config.get('MAIL_MAX_RETRIES', 3)
+    self.retry_backoff = app.config.get('MAIL_RETRY_BACKOFF', 1.0)
+    self.idle_timeout = app.config.get('MAIL_CONNECTION_IDLE_TIMEOUT', 30)
+    self._queue = queue.Queue(maxsize=app.config.get('MAIL_QUEUE_SIZE', 1000))
+    app.extensions['mail_queue'] = self
+    atexit.register(self.shutdown)
+
+  def _start(self):
+    # Threads do not survive a fork, so workers are started lazily in the
+    # process that actually enqueues.
+    with self._lock:
+      if self._pid == os.getpid():
+        return
+      self._pid = os.getpid()
+      self._workers = [
+        threading.Thread(target=self._run, name=f"mail-worker-{i}", daemon=True)
+        for i in range(self.workers)
+      ]
+      for worker in self._workers:
+        worker.start()
+
+  def enqueue(self, message):
+    """Queue `message` for delivery; returns False if the queue is full."""
+    if self._pid != os.getpid():
+      self._start()
+    try:
+      self._queue.put_nowait(message)
+    except queue.Full:
+      logger.error(f"Mail queue full, dropping message to {message.recipients}")
+      return False
+    return True
+
+  def join(self):
+    """Block until every queued message has been handled."""
+    self._queue.join()
+
+  def shutdown(self, timeout=10):
+    if self._pid != os.getpid():
+      return
+    for _ in self._workers:
+      self._queue.put(_STOP)
+    deadline = time.monotonic() + timeout
+    for worker in self._workers:
+      worker.join(max(0, deadline - time.monotonic()))
+    self._pid = None
+
+  def _run(self):
+    with self.app.app_context():
+      connection = None
+      while True:
+        try:
+          message = self._queue.get(timeout=self.idle_timeout)
+        except queue.Empty:
+          connection = self._close(connection)
+          continue
+
+        try:
+          if message is _STOP:
+            connection = self._close(connection)
+            return
+          connection = self._deliver(connection, message)
+        finally:
+          self._queue.task_done()
+
+  def _deliver(self, connection, message):
+    for attempt in range(self.max_retries + 1):
+      try:
+        if connection is None:
+          connection = mail.connect().__enter__()
+        connection.send(message)
+        return connection
+      except Exception as e:
+        connection = self._close(connection)
+        if attempt == self.max_retries:
+          logger.error(
+            f"Giving up on mail to {message.recipients} after "
+            f"{attempt + 1} attempts: {str(e)}"
+          )
+        else:
+          time.sleep(self.retry_backoff * 2 ** attempt)
+    return connection
+
+  def _close(self, connection):
+    if connection is not None and connection.host is not None:
+      try:
+        connection.host.quit()
+      except Exception:
+        connection.host.close()
+    return None
+
+
+mail_queue = MailQueue()
+
+
 def send_email(to, subject, template):
   msg = Message(
     subject,
     recipients=[to],
     html = template,
-    sender = current_app.config['MAIL_DEFAULT_SENDER']
+    sender = current_app.config.get('MAIL_DEFAULT_SENDER')
   )
-  mail.send(msg)
\ No newline at end of file
+  if current_app.config.get('MAIL_ASYNC', True):
+    return mail_queue.enqueue(msg)
+  mail.send(msg)
+  return True
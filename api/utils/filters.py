@@ -0,0 +1,80 @@
+"""Whitelisted filters and sort orders for list endpoints.
+
+Each list endpoint declares the query parameters it accepts and the indexed
+columns they compile to; anything else is rejected with a 400 instead of
+silently turning into a full table scan.
+"""
+from flask import request
+
+# Parameters consumed by pagination, streaming and includes.
+RESERVED = {'limit', 'cursor', 'include', 'stream', 'sort'}
+
+
+class InvalidFilter(ValueError):
+  pass
+
+
+def prefix(column, value):
+  escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+  return column.like(f"{escaped}%", escape='\\')
+
+
+class Filter(object):
+  def __init__(self, column, compare, parse=str, requires=None):
+    self.column = column
+    self.compare = compare
+    self.parse = parse
+    self.requires = requires
+
+
+class Sort(object):
+  def __init__(self, *columns, requires=None):
+    self.columns = columns
+    self.requires = requires
+
+
+class ListQuery(object):
+  def __init__(self, filters, sorts, default_sort):
+    self.filters = filters
+    self.sorts = sorts
+    self.default_sort = default_sort
+
+  def _check_requires(self, name, requires, args):
+    if requires is not None and requires not in args:
+      raise InvalidFilter(f"{name} can only be used together with {requires}")
+
+  def apply(self, query, args=None):
+    """Filter `query` from the request arguments.
+
+    Returns the filtered query, the keyset columns for the requested sort
+    and whether that sort is descending.
+    """
+    args = request.args if args is None else args
+
+    unknown = set(args) - RESERVED - set(self.filters)
+    if unknown:
+      raise InvalidFilter(f"Unsupported filter(s): {', '.join(sorted(unknown))}")
+
+    for name, spec in self.filters.items():
+      raw = args.get(name)
+      if raw is None:
+        continue
+      self._check_requires(name, spec.requires, args)
+      try:
+        value = spec.parse(raw)
+      except ValueError:
+        raise InvalidFilter(f"Invalid value for {name}")
+      query = query.filter(spec.compare(spec.column, value))
+
+    sort = args.get('sort', self.default_sort)
+    descending = sort.startswith('-')
+    name = sort[1:] if descending else sort
+    spec = self.sorts.get(name)
+    if spec is None:
+      raise InvalidFilter(
+        f"sort must be one of: {', '.join(sorted(self.sorts))} (prefix - to reverse)"
+      )
+    self._check_requires(f"sort={name}", spec.requires, args)
+
+    return query, spec.columns, descending
+
@@ -0,0 +1,88 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from passlib.hash import pbkdf2_sha256
+import os
+import threading
+
+
+class HashingUnavailable(RuntimeError):
+  pass
+
+
+def _hash(password, rounds):
+  return pbkdf2_sha256.using(rounds=rounds).hash(password)
+
+
+def _verify(password, hash):
+  return pbkdf2_sha256.verify(password, hash)
+
+
+class PasswordHasher(object):
+  """Runs PBKDF2 on a process pool so hashing never holds a request's GIL.
+
+  PASSWORD_HASH_WORKERS = 0 hashes inline on the calling thread. At most
+  PASSWORD_HASH_MAX_PENDING hashes are queued or running per process; a
+  caller that cannot get a slot, or whose hash does not finish, within
+  PASSWORD_HASH_TIMEOUT seconds gets HashingUnavailable instead of piling
+  up behind a login storm. A slot is held until its task leaves the pool,
+  even if the caller gave up waiting.
+  """
+
+  def __init__(self, app=None):
+    self.rounds = pbkdf2_sha256.default_rounds
+    self.workers = 0
+    self.timeout = 10
+    self._slots = None
+    self._executor = None
+    self._pid = None
+    self._lock = threading.Lock()
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    self.rounds = app.config.get('PASSWORD_HASH_ROUNDS', pbkdf2_sha256.default_rounds)
+    self.workers = app.config.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+    self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', 10)
+    max_pending = app.config.get('PASSWORD_HASH_MAX_PENDING', 4 * max(self.workers, 1))
+    self._slots = threading.BoundedSemaphore(max_pending)
+    app.extensions['password_hasher'] = self
+
+  def _pool(self):
+    # A pool inherited through fork has no live workers; build one per process.
+    if self._pid != os.getpid():
+      with self._lock:
+        if self._pid != os.getpid():
+          self._executor = ProcessPoolExecutor(max_workers=self.workers)
+          self._pid = os.getpid()
+    return self._executor
+
+  def _run(self, function, *args):
+    if not self.workers:
+      return function(*args)
+
+    if not self._slots.acquire(timeout=self.timeout):
+      raise HashingUnavailable("Password hashing is overloaded")
+    try:
+      future = self._pool().submit(function, *args)
+    except BaseException:
+      self._slots.release()
+      raise
+    future.add_done_callback(lambda _: self._slots.release())
+
+    try:
+      return future.result(timeout=self.timeout)
+    except FutureTimeout:
+      # Frees the slot now if the task has not started yet.
+      future.cancel()
+      raise HashingUnavailable("Password hashing timed out")
+
+  def hash(self, password):
+    return self._run(_hash, password, self.rounds)
+
+  def verify(self, password, hash):
+    return self._run(_verify, password, hash)
+
+  def needs_rehash(self, hash):
+    return pbkdf2_sha256.using(rounds=self.rounds).needs_update(hash)
+
+
+hasher = PasswordHasher()
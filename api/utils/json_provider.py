@@ -0,0 +1,71 @@
+"""JSON providers selected with JSON_BACKEND.
+
+* ``auto``   - orjson when it is installed, the standard library otherwise.
+* ``orjson`` - orjson (``pip install orjson``); fails at start-up if missing.
+* ``stdlib`` - Flask's default provider.
+
+Both providers add `dumps_bytes`, which `response_with` uses to hand the
+encoded body straight to the response without a str round trip. Key
+order and compact separators match Flask's defaults. The bodies are the
+same except in two cases:
+- orjson writes non-ASCII text as UTF-8 where the stdlib provider uses
+  \\u escapes.
+- Raw datetimes become ISO 8601 under orjson and HTTP dates under the
+  stdlib provider. The schemas already dump datetimes as ISO strings.
+"""
+from decimal import Decimal
+from flask.json.provider import DefaultJSONProvider
+import dataclasses
+
+try:
+  import orjson
+except ImportError:  # optional dependency
+  orjson = None
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+  def dumps_bytes(self, obj):
+    # Compact, like jsonify outside debug mode.
+    return self.dumps(obj, separators=(',', ':')).encode()
+
+
+def _orjson_default(obj):
+  if isinstance(obj, Decimal):
+    return str(obj)
+  if hasattr(obj, '__html__'):
+    return str(obj.__html__())
+  if dataclasses.is_dataclass(obj):
+    return dataclasses.asdict(obj)
+  raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(DefaultJSONProvider):
+  def _options(self, kwargs):
+    options = orjson.OPT_NON_STR_KEYS
+    if kwargs.get('sort_keys', self.sort_keys):
+      options |= orjson.OPT_SORT_KEYS
+    if kwargs.get('indent'):
+      options |= orjson.OPT_INDENT_2
+    return options
+
+  def dumps_bytes(self, obj, **kwargs):
+    return orjson.dumps(obj, default=_orjson_default, option=self._options(kwargs))
+
+  def dumps(self, obj, **kwargs):
+    return self.dumps_bytes(obj, **kwargs).decode()
+
+  def loads(self, s, **kwargs):
+    return orjson.loads(s)
+
+
+def init_json(app):
+  backend = app.config.get('JSON_BACKEND', 'auto')
+  if backend not in ('auto', 'orjson', 'stdlib'):
+    raise ValueError(f"Unknown JSON_BACKEND {backend!r}")
+  if backend == 'orjson' and orjson is None:
+    raise RuntimeError("JSON_BACKEND is 'orjson' but orjson is not installed")
+
+  if backend != 'stdlib' and orjson is not None:
+    app.json = OrjsonProvider(app)
+  else:
+    app.json = StdlibJSONProvider(app)
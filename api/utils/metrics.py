@@ -0,0 +1,316 @@
+"""Request, database pool and serialization metrics in Prometheus format.
+
+Every thread records into its own store, so the hot path only updates
+thread-local dicts and takes no lock. A scrape merges the stores of the
+current process. When METRICS_DIR is set, each process also writes its
+merged snapshot to `<METRICS_DIR>/metrics-<pid>.json`, every
+METRICS_FLUSH_INTERVAL seconds and on every scrape. /metrics then sums the
+snapshots of all worker processes. Counters and histograms of processes
+that have exited are kept, and their gauges are dropped. Clear METRICS_DIR
+when deploying.
+"""
+from flask import Blueprint, Response, g, request
+from api.utils.database import db
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+WAIT_BUCKETS = (.0005, .001, .005, .01, .05, .1, .5, 1, 5, 10)
+SERIALIZATION_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, 1)
+
+# name -> (type, help, buckets)
+METRICS = {
+  'http_requests_total': ('counter', "HTTP requests handled.", None),
+  'http_request_duration_seconds': (
+    'histogram', "Time until the response object is returned.", LATENCY_BUCKETS),
+  'http_requests_in_flight': ('gauge', "HTTP requests being handled.", None),
+  'db_pool_checkouts_total': ('counter', "Connections checked out of the pool.", None),
+  'db_pool_checkout_wait_seconds': (
+    'histogram', "Time spent waiting for a pooled connection.", WAIT_BUCKETS),
+  'serialization_duration_seconds': (
+    'histogram', "Time spent dumping models with a schema.", SERIALIZATION_BUCKETS),
+  'cache_requests_total': ('counter', "Resource cache lookups.", None),
+}
+
+
+class _Store(object):
+  def __init__(self, thread):
+    self.thread = thread
+    self.pid = os.getpid()
+    self.values = {}
+    self.histograms = {}
+
+
+class Metrics(object):
+  def __init__(self):
+    self.enabled = False
+    self.directory = None
+    self.flush_interval = 5
+    self._local = threading.local()
+    self._stores = []
+    self._retired = _Store(None)
+    self._lock = threading.Lock()
+    self._flusher_pid = None
+
+  def init_app(self, app):
+    self.enabled = app.config.get('METRICS_ENABLED', False)
+    if not self.enabled:
+      return
+    self.directory = app.config.get('METRICS_DIR')
+    self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', 5)
+    if self.directory:
+      os.makedirs(self.directory, exist_ok=True)
+
+    app.before_request(self._before_request)
+    app.after_request(self._after_request)
+    app.teardown_request(self._teardown_request)
+    app.register_blueprint(metrics_routes)
+    with app.app_context():
+      for engine in db.engines.values():
+        self.instrument_pool(engine.pool)
+    app.extensions['metrics'] = self
+
+  # -- recording ------------------------------------------------------------
+
+  def _store(self):
+    store = getattr(self._local, 'store', None)
+    if store is None or store.pid != os.getpid():
+      # New thread, or a forked worker that must not repeat its parent's counts.
+      store = self._local.store = _Store(threading.current_thread())
+      with self._lock:
+        self._stores.append(store)
+      if self.directory and self._flusher_pid != os.getpid():
+        self._start_flusher()
+    return store
+
+  def inc(self, name, amount=1, **labels):
+    if not self.enabled:
+      return
+    values = self._store().values
+    key = (name, tuple(sorted(labels.items())))
+    values[key] = values.get(key, 0) + amount
+
+  def observe(self, name, value, **labels):
+    if not self.enabled:
+      return
+    histograms = self._store().histograms
+    key = (name, tuple(sorted(labels.items())))
+    histogram = histograms.get(key)
+    if histogram is None:
+      buckets = METRICS[name][2]
+      histogram = histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+    counts = histogram[0]
+    for i, bound in enumerate(METRICS[name][2]):
+      if value <= bound:
+        counts[i] += 1
+        break
+    else:
+      counts[-1] += 1
+    histogram[1] += value
+
+  def timed(self, name, **labels):
+    return _Timer(self, name, labels)
+
+  # -- request hooks --------------------------------------------------------
+
+  def _before_request(self):
+    g._metrics_started = time.perf_counter()
+    g._metrics_in_flight = True
+    self.inc('http_requests_in_flight')
+
+  def _record(self, status):
+    started = g.pop('_metrics_started', None)
+    if started is None:
+      return
+    rule = request.url_rule
+    endpoint = rule.endpoint if rule is not None else 'unmatched'
+    labels = {'endpoint': endpoint, 'method': request.method, 'status': str(status)}
+    self.inc('http_requests_total', **labels)
+    self.observe('http_request_duration_seconds', time.perf_counter() - started, **labels)
+
+  def _after_request(self, response):
+    self._record(response.status_code)
+    return response
+
+  def _teardown_request(self, exc):
+    # Only still pending when the view raised past the error handlers.
+    self._record(500)
+    if g.pop('_metrics_in_flight', False):
+      self.inc('http_requests_in_flight', -1)
+
+  def instrument_pool(self, pool):
+    """Time checkouts from `pool`; asgi.py passes its asyncio pools too."""
+    do_get = pool._do_get
+
+    def timed_do_get():
+      started = time.perf_counter()
+      try:
+        return do_get()
+      finally:
+        self.inc('db_pool_checkouts_total')
+        self.observe('db_pool_checkout_wait_seconds', time.perf_counter() - started)
+
+    pool._do_get = timed_do_get
+
+  # -- aggregation ----------------------------------------------------------
+
+  def snapshot(self):
+    """Merge the per-thread stores of this process."""
+    values, histograms = {}, {}
+    with self._lock:
+      if self._retired.pid != os.getpid():
+        self._retired = _Store(None)
+      live = []
+      for store in self._stores:
+        if store.pid != os.getpid():
+          continue
+        if store.thread.is_alive():
+          live.append(store)
+        else:
+          _merge(self._retired.values, self._retired.histograms,
+                 store.values.copy(), store.histograms.copy())
+      self._stores = live
+      stores = [self._retired] + live
+    for store in stores:
+      _merge(values, histograms, store.values.copy(), store.histograms.copy())
+    return {
+      'values': [[name, list(labels), value] for (name, labels), value in values.items()],
+      'histograms': [[name, list(labels), counts, total]
+                     for (name, labels), (counts, total) in histograms.items()],
+    }
+
+  def _path(self, pid):
+    return os.path.join(self.directory, f"metrics-{pid}.json")
+
+  def write_snapshot(self):
+    path = self._path(os.getpid())
+    with open(path + '.tmp', 'w') as snapshot:
+      json.dump(self.snapshot(), snapshot)
+    os.replace(path + '.tmp', path)
+
+  def _start_flusher(self):
+    with self._lock:
+      if self._flusher_pid == os.getpid():
+        return
+      self._flusher_pid = os.getpid()
+    threading.Thread(target=self._run_flusher, name="metrics-flusher", daemon=True).start()
+
+  def _run_flusher(self):
+    while True:
+      time.sleep(self.flush_interval)
+      try:
+        self.write_snapshot()
+      except OSError as e:
+        logger.error(f"Failed to write metrics snapshot: {str(e)}")
+
+  def collect(self):
+    """Merged values and histograms of every process."""
+    snapshots = [self.snapshot()]
+    if self.directory:
+      self.write_snapshot()
+      snapshots = []
+      for entry in os.scandir(self.directory):
+        if not (entry.name.startswith('metrics-') and entry.name.endswith('.json')):
+          continue
+        try:
+          with open(entry.path) as snapshot:
+            data = json.load(snapshot)
+        except (OSError, ValueError):
+          continue
+        if not _alive(int(entry.name[len('metrics-'):-len('.json')])):
+          data['values'] = [item for item in data['values'] if METRICS[item[0]][0] != 'gauge']
+        snapshots.append(data)
+
+    values, histograms = {}, {}
+    for data in snapshots:
+      _merge(
+        values, histograms,
+        {(name, tuple(map(tuple, labels))): value for name, labels, value in data['values']},
+        {(name, tuple(map(tuple, labels))): (counts, total)
+         for name, labels, counts, total in data['histograms']},
+      )
+    return values, histograms
+
+  def render(self):
+    values, histograms = self.collect()
+    lines = []
+    for name, (kind, help, buckets) in METRICS.items():
+      lines.append(f"# HELP {name} {help}")
+      lines.append(f"# TYPE {name} {kind}")
+      if kind == 'histogram':
+        for (metric, labels), (counts, total) in sorted(histograms.items()):
+          if metric != name:
+            continue
+          cumulative = 0
+          for bound, count in zip(buckets + ('+Inf',), counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+          lines.append(f"{name}_sum{_labels(labels)} {total}")
+          lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+      else:
+        for (metric, labels), value in sorted(values.items()):
+          if metric == name:
+            lines.append(f"{name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class _Timer(object):
+  def __init__(self, metrics, name, labels):
+    self.metrics = metrics
+    self.name = name
+    self.labels = labels
+
+  def __enter__(self):
+    self.started = time.perf_counter()
+    return self
+
+  def __exit__(self, *exc):
+    self.metrics.observe(self.name, time.perf_counter() - self.started, **self.labels)
+
+
+def _merge(values, histograms, new_values, new_histograms):
+  for key, value in new_values.items():
+    values[key] = values.get(key, 0) + value
+  for key, (counts, total) in new_histograms.items():
+    merged = histograms.get(key)
+    if merged is None:
+      histograms[key] = [list(counts), total]
+    else:
+      merged[0] = [a + b for a, b in zip(merged[0], counts)]
+      merged[1] += total
+
+
+def _alive(pid):
+  try:
+    os.kill(pid, 0)
+  except ProcessLookupError:
+    return False
+  except PermissionError:
+    pass
+  return True
+
+
+def _escape(value):
+  return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+  if not labels:
+    return ''
+  return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+metrics_routes = Blueprint("metrics_routes", __name__)
+
+
+@metrics_routes.route("/metrics", methods=['GET'])
+def prometheus_metrics():
+  return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+metrics = Metrics()
@@ -0,0 +1,115 @@
+import base64
+import binascii
+import json
+from flask import request, current_app
+from sqlalchemy import tuple_
+
+
+class InvalidPageRequest(ValueError):
+  pass
+
+
+def encode_cursor(values):
+  raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+  return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+  padded = cursor + '=' * (-len(cursor) % 4)
+  try:
+    values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+  except (ValueError, binascii.Error, UnicodeError):
+    raise InvalidPageRequest("Invalid cursor")
+
+  if not isinstance(values, list) or not all(
+      isinstance(v, (int, str)) and not isinstance(v, bool) for v in values):
+    raise InvalidPageRequest("Invalid cursor")
+  return values
+
+
+def page_args():
+  """Read `limit` and `cursor` from the query string."""
+  default_limit = current_app.config.get('DEFAULT_PAGE_LIMIT', 50)
+  max_limit = current_app.config.get('MAX_PAGE_LIMIT', 500)
+
+  raw_limit = request.args.get('limit')
+  if raw_limit is None:
+    limit = default_limit
+  else:
+    try:
+      limit = int(raw_limit)
+    except ValueError:
+      raise InvalidPageRequest("limit must be an integer")
+    if not 1 <= limit <= max_limit:
+      raise InvalidPageRequest(f"limit must be between 1 and {max_limit}")
+
+  return limit, request.args.get('cursor') or None
+
+
+def order_by(columns, descending=False):
+  return [column.desc() for column in columns] if descending else list(columns)
+
+
+def after(query, columns, values, descending=False):
+  """Restrict `query` to rows strictly past `values` in sort order."""
+  if len(columns) == 1:
+    left, right = columns[0], values[0]
+  else:
+    left, right = tuple_(*columns), tuple_(*values)
+  return query.filter(left < right if descending else left > right)
+
+
+def keyset_query(query, columns, limit, cursor=None, descending=False):
+  """Restrict `query` (a Query or a Select) to the page after `cursor`.
+
+  One row more than `limit` is fetched to tell whether a next page exists.
+  """
+  if cursor is not None:
+    values = decode_cursor(cursor)
+    if len(values) != len(columns):
+      raise InvalidPageRequest("Invalid cursor")
+    query = after(query, columns, values, descending)
+
+  return query.order_by(*order_by(columns, descending)).limit(limit + 1)
+
+
+def keyset_page(items, columns, limit):
+  """Trim the rows of a `keyset_query` and build the pagination info."""
+  next_cursor = None
+  if len(items) > limit:
+    items = items[:limit]
+    next_cursor = encode_cursor([getattr(items[-1], c.key) for c in columns])
+
+  return items, {'limit': limit, 'next_cursor': next_cursor}
+
+
+def keyset_paginate(query, columns, limit, cursor=None, descending=False):
+  """Return one page of `query` ordered by `columns` plus its pagination info.
+
+  The cursor carries the sort key of the last row of the previous page, so
+  the next page is a range scan on the index instead of an OFFSET.
+  """
+  items = keyset_query(query, columns, limit, cursor, descending).all()
+  return keyset_page(items, columns, limit)
+
+
+def iter_keyset(query, columns, chunk_size, descending=False):
+  """Yield successive lists of at most `chunk_size` rows of `query`.
+
+  Each chunk is its own bounded, index-ordered SELECT, so the connection is
+  never held by an open cursor between chunks.
+  """
+  last = None
+  while True:
+    chunk_query = query
+    if last is not None:
+      chunk_query = after(chunk_query, columns, last, descending)
+
+    rows = chunk_query.order_by(*order_by(columns, descending))\
+                      .limit(chunk_size).all()
+    if not rows:
+      return
+    last = [getattr(rows[-1], c.key) for c in columns]
+    yield rows
+    if len(rows) < chunk_size:
+      return
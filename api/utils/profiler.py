@@ -0,0 +1,124 @@
+"""Opt-in per-request SQL profiling.
+
+With SQL_PROFILER_ENABLED, every statement run while handling a request is
+counted and timed. Statements slower than SQL_SLOW_QUERY_MS are logged
+together with their parameters and the route. A statement shape that
+repeats SQL_N_PLUS_ONE_THRESHOLD times or more within one request is
+reported as a likely N+1 pattern. A shape is the SQL text with expanded
+IN lists collapsed.
+
+The summary goes into X-SQL-* response headers when SQL_PROFILER_HEADERS
+is set (development). Otherwise it is written as one JSON log line per
+request. Statements that run while a streamed body is generated finish
+after the summary and are not included.
+"""
+from collections import Counter
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from api.utils.database import db
+import json
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+_PLACEHOLDER = r"(?:\?|%s|%\(\w+\)s|:\w+)"
+_EXPANDED_LIST = re.compile(rf"\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement):
+  return _EXPANDED_LIST.sub("(...)", _WHITESPACE.sub(" ", statement).strip())
+
+
+def _header_value(text, limit=200):
+  # Keep both ends: the selected table and the WHERE clause identify the loop.
+  text = text.encode('latin-1', 'replace').decode('latin-1')
+  if len(text) <= limit:
+    return text
+  half = (limit - 5) // 2
+  return f"{text[:half]} ... {text[-half:]}"
+
+
+class SQLProfiler(object):
+  def __init__(self):
+    self.enabled = False
+    self.slow_ms = 100
+    self.threshold = 5
+    self.headers = False
+
+  def init_app(self, app):
+    self.enabled = app.config.get('SQL_PROFILER_ENABLED', False)
+    if not self.enabled:
+      return
+    self.slow_ms = app.config.get('SQL_SLOW_QUERY_MS', 100)
+    self.threshold = app.config.get('SQL_N_PLUS_ONE_THRESHOLD', 5)
+    headers = app.config.get('SQL_PROFILER_HEADERS')
+    self.headers = app.debug if headers is None else headers
+
+    with app.app_context():
+      for engine in db.engines.values():
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+    app.after_request(self._report)
+    app.extensions['sql_profiler'] = self
+
+  def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('profiler_started', []).append(time.perf_counter())
+
+  def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+    elapsed = (time.perf_counter() - conn.info['profiler_started'].pop()) * 1000
+    in_request = has_request_context()
+
+    if elapsed >= self.slow_ms:
+      logger.warning(json.dumps({
+        'event': 'slow_query',
+        'route': request.endpoint if in_request else None,
+        'duration_ms': round(elapsed, 2),
+        'statement': statement,
+        'parameters': repr(parameters)[:1000],
+        'executemany': executemany,
+      }))
+
+    if in_request:
+      profile = g.get('_sql_profile')
+      if profile is None:
+        profile = g._sql_profile = {'count': 0, 'time': 0.0, 'shapes': Counter()}
+      profile['count'] += 1
+      profile['time'] += elapsed
+      profile['shapes'][statement_shape(statement)] += 1
+
+  def _report(self, response):
+    profile = g.pop('_sql_profile', None)
+    if profile is None:
+      return response
+
+    repeated = [(shape, count) for shape, count in profile['shapes'].most_common()
+                if count >= self.threshold]
+
+    if self.headers:
+      response.headers['X-SQL-Count'] = str(profile['count'])
+      response.headers['X-SQL-Time-Ms'] = f"{profile['time']:.2f}"
+      if repeated:
+        shape, count = repeated[0]
+        response.headers['X-SQL-N-Plus-One'] = _header_value(f"{count}x {shape}")
+      return response
+
+    summary = {
+      'event': 'sql_profile',
+      'route': request.endpoint,
+      'method': request.method,
+      'status': response.status_code,
+      'queries': profile['count'],
+      'duration_ms': round(profile['time'], 2),
+    }
+    if repeated:
+      summary['n_plus_one'] = [{'statement': shape, 'count': count} for shape, count in repeated]
+      logger.warning(json.dumps(summary))
+    else:
+      logger.info(json.dumps(summary))
+    return response
+
+
+sql_profiler = SQLProfiler()
@@ -1,4 +1,7 @@
-from flask import make_response, jsonify
+from flask import current_app, stream_with_context
+import logging
+
+logger = logging.getLogger(__name__)
 
 INVALID_FIELD_NAME_SENT_422 = {
     "http_code": 422,
@@ -30,6 +33,21 @@ SERVER_ERROR_404 = {
     "code": "notFound",
     "message": "Resource not found"
 }
+CONFLICT_409 = {
+    "http_code": 409,
+    "code": "conflict",
+    "message": "Resource was modified by another request"
+}
+PRECONDITION_FAILED_412 = {
+    "http_code": 412,
+    "code": "preconditionFailed",
+    "message": "Resource does not match If-Match"
+}
+SERVICE_UNAVAILABLE_503 = {
+    "http_code": 503,
+    "code": "serviceUnavailable",
+    "message": "Service temporarily unavailable, please retry"
+}
 UNAUTHORIZED_403 = {
     "http_code": 403,
     "code": "notAuthorized",
@@ -53,26 +71,79 @@ SUCCESS_204 = {
 }
 
 
+STATIC_HEADERS = (
+  ('Access-Control-Allow-Origin', '*'),
+  ('server', 'Flask REST API'),
+)
+
+
 def response_with(response, value=None, message=None, error=None,
-                  headers={}, pagination=None):
-  result = {}
-  if value is not None:
-    result.update(value)
+                  headers=None, pagination=None):
+  """Build the JSON envelope; `value` is extended in place, not copied."""
+  result = value if value is not None else {}
 
   if message is not None:
-    result.update({'message': message})
+    result['message'] = message
   elif response.get('message', None) is not None:
-    result.update({'message': response['message']})
-  
-  result.update({'code': response['code']})
+    result['message'] = response['message']
+
+  result['code'] = response['code']
 
   if error is not None:
-    result.update({'errors': error})
-  
+    result['errors'] = error
+
   if pagination is not None:
-    result.update({'errors': pagination})
+    result['pagination'] = pagination
+
+  if headers:
+    response_headers = list(STATIC_HEADERS)
+    response_headers.extend(headers.items())
+  else:
+    response_headers = STATIC_HEADERS
+
+  return current_app.response_class(
+    current_app.json.dumps_bytes(result) + b"\n",
+    status=response['http_code'],
+    headers=response_headers,
+    mimetype='application/json'
+  )
+
+
+def stream_response_with(response, key, chunks, message=None, headers=None):
+  """Stream `{key: [...], "code": ..., "message": ...}` from `chunks`.
+
+  `chunks` yields lists of already serialized items; each list is encoded
+  and written out before the next one is produced.
+  """
+  dumps = current_app.json.dumps_bytes
+  tail = {'code': response['code']}
+  if message is not None:
+    tail['message'] = message
+  elif response.get('message', None) is not None:
+    tail['message'] = response['message']
+
+  def generate():
+    yield b'{' + dumps(key) + b':['
+    separator = b''
+    try:
+      for chunk in chunks:
+        if chunk:
+          yield separator + b','.join(dumps(item) for item in chunk)
+          separator = b','
+    except Exception as e:
+      # The status line is already sent; a truncated body is the only
+      # signal left to the client.
+      logger.error(f"Error while streaming {key}: {str(e)}")
+      return
+    yield b'],' + dumps(tail)[1:]
 
-  headers.update({'Access-Control-Allow-Origin': '*'})
-  headers.update({'server': 'Flask REST API'})
+  stream_headers = dict(STATIC_HEADERS)
+  if headers:
+    stream_headers.update(headers)
 
-  return make_response(jsonify(result), response['http_code'], headers)
\ No newline at end of file
+  return current_app.response_class(
+    stream_with_context(generate()),
+    status=response['http_code'],
+    headers=stream_headers,
+    mimetype='application/json'
+  )
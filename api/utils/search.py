@@ -0,0 +1,347 @@
+"""In-memory inverted index over author names and book titles.
+
+Every document is tokenized into lower-cased words. Postings map a word to
+the documents containing it, and a sorted list of all words answers prefix
+(typeahead) lookups with two bisections. A query matches documents that
+contain every query term, either as a whole word or as a word prefix;
+whole-word matches rank higher, then shorter labels.
+
+The index is built once per worker process, in the background on its
+first request, or on the first search otherwise. It is then kept up to date
+from ORM events on Author and Book: changes are collected during flush and
+applied only when the transaction commits. Writes that bypass the ORM
+(bulk inserts and deletes) call `catch_up()` / `remove()` themselves.
+
+Each worker process holds its own index and only sees its own events.
+Every delete therefore also writes a row to `search_tombstones` in the same
+transaction. A background thread in each worker re-reads, every
+SEARCH_REFRESH_INTERVAL seconds, the rows inserted or updated since its
+last refresh and the tombstones written since, so `search()` never touches
+the database once the index is built. Rows deleted with raw SQL must be
+passed to `remove()` to leave a tombstone.
+"""
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import event, select, insert, delete, func
+from sqlalchemy.orm import object_session
+from api.utils.database import db, RoutingSession
+from api.models.search import SearchTombstone
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+# Rows committed a little after their updated_at was set must not slip
+# between two refreshes.
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+# Far longer than any refresh interval; a freshly built index needs none.
+TOMBSTONE_RETENTION = timedelta(days=1)
+
+
+def tokenize(text):
+  return list(dict.fromkeys(_WORD.findall((text or '').lower())))
+
+
+class SearchIndex(object):
+  def __init__(self):
+    self.app = None
+    self.max_expansions = 50
+    self.refresh_interval = 30
+    self._sources = {}
+    self._docs = {}
+    self._postings = {}
+    self._terms = []
+    self._max_id = {}
+    self._tombstone_id = 0
+    self._built_pid = None
+    self._warming_pid = None
+    self._refresher_pid = None
+    self._refreshed_at = None
+    self._lock = threading.RLock()
+    self._refresh_lock = threading.Lock()
+
+  def register(self, kind, model, fields):
+    """Index `model` rows as `kind`, labelled by the given columns."""
+    self._sources[kind] = (model, fields)
+    self._max_id[kind] = 0
+
+    def changed(mapper, connection, target):
+      _pending(target).append(('add', kind, target.id, _label(target, fields)))
+
+    def deleted(mapper, connection, target):
+      connection.execute(insert(SearchTombstone.__table__).values(kind=kind, doc_id=target.id))
+      _pending(target).append(('remove', kind, target.id, None))
+
+    event.listen(model, 'after_insert', changed)
+    event.listen(model, 'after_update', changed)
+    event.listen(model, 'after_delete', deleted)
+
+  def init_app(self, app):
+    self.app = app
+    self.max_expansions = app.config.get('SEARCH_MAX_EXPANSIONS', 50)
+    self.refresh_interval = app.config.get('SEARCH_REFRESH_INTERVAL', 30)
+    app.extensions['search_index'] = self
+    if app.config.get('SEARCH_BUILD_ON_FIRST_REQUEST', False):
+      # Not at import/create_app time: the CLI must not query the database,
+      # and a pre-forking master must not build (and connect) for its workers.
+      app.before_request(self._start_warm_up)
+
+  # -- building ---------------------------------------------------------
+
+  def ensure_built(self):
+    if self._built_pid == os.getpid():
+      return
+    with self._lock:
+      if self._built_pid != os.getpid():
+        self.build()
+
+  def _start_warm_up(self):
+    if self._warming_pid != os.getpid():
+      self._warming_pid = os.getpid()
+      threading.Thread(target=self._warm_up, name="search-index-build", daemon=True).start()
+
+  def _warm_up(self):
+    try:
+      self.ensure_built()
+    except Exception as e:
+      # The first search retries the build.
+      logger.error(f"Search index build failed: {str(e)}")
+
+  def build(self):
+    started = time.perf_counter()
+    with self._lock:
+      self._refreshed_at = _utcnow()
+      self._docs, self._postings, self._terms = {}, {}, []
+      with self.app.app_context():
+        # Taken first: tombstones written during the load are applied later.
+        self._tombstone_id = db.session.scalar(select(func.max(SearchTombstone.id))) or 0
+        for kind in self._sources:
+          self._max_id[kind] = 0
+          model, fields = self._sources[kind]
+          rows = db.session.execute(
+            select(*_columns(model, fields)).execution_options(yield_per=10000)
+          )
+          for row in rows:
+            self._add(kind, row.id, _label(row, fields), sort_terms=False)
+      self._terms.sort()
+      self._built_pid = os.getpid()
+    logger.info(
+      f"Search index built: {len(self._docs)} documents, {len(self._terms)} terms "
+      f"in {time.perf_counter() - started:.2f}s"
+    )
+    self._start_refresher()
+
+  def _fetch(self, kind, condition):
+    # Read outside self._lock, so searches are not held up by the database.
+    model, fields = self._sources[kind]
+    rows = db.session.execute(select(*_columns(model, fields)).where(condition))
+    return [('add', kind, row.id, _label(row, fields)) for row in rows]
+
+  def catch_up(self, kind):
+    """Index rows of `kind` inserted without ORM events (bulk inserts)."""
+    if self._built_pid != os.getpid():
+      return
+    model, _ = self._sources[kind]
+    with self.app.app_context():
+      changes = self._fetch(kind, model.id > self._max_id[kind])
+    self.apply(changes)
+
+  # -- refreshing -----------------------------------------------------------
+
+  def _start_refresher(self):
+    if self.refresh_interval > 0 and self._refresher_pid != os.getpid():
+      self._refresher_pid = os.getpid()
+      threading.Thread(target=self._refresh_loop, name="search-index-refresh", daemon=True).start()
+
+  def _refresh_loop(self):
+    while True:
+      time.sleep(self.refresh_interval)
+      try:
+        self.refresh()
+      except Exception as e:
+        logger.error(f"Search index refresh failed: {str(e)}")
+
+  def refresh(self):
+    """Apply the inserts, updates and deletes committed since the last refresh."""
+    if self._built_pid != os.getpid():
+      return
+    with self._refresh_lock:
+      since = self._refreshed_at - REFRESH_OVERLAP
+      refreshed_at = _utcnow()
+      changes = []
+      with self.app.app_context():
+        for kind, (model, _) in self._sources.items():
+          changes += self._fetch(kind, model.id > self._max_id[kind])
+          changes += self._fetch(kind, model.updated_at >= since)
+        # Read after the rows, so a row deleted meanwhile is removed again.
+        tombstones = db.session.execute(
+          select(SearchTombstone.id, SearchTombstone.kind, SearchTombstone.doc_id)
+          .where(SearchTombstone.id > self._tombstone_id)
+          .order_by(SearchTombstone.id)
+        ).all()
+        db.session.execute(
+          delete(SearchTombstone)
+          .where(SearchTombstone.deleted_at < refreshed_at - TOMBSTONE_RETENTION)
+        )
+        db.session.commit()
+      changes += [('remove', row.kind, row.doc_id, None) for row in tombstones]
+      self.apply(changes)
+      if tombstones:
+        self._tombstone_id = tombstones[-1].id
+      self._refreshed_at = refreshed_at
+
+  # -- updates ------------------------------------------------------------
+
+  def _add(self, kind, id, label, sort_terms=True):
+    key = (kind, id)
+    self._remove(key)
+    tokens = tokenize(label)
+    self._docs[key] = (label, tokens)
+    for token in tokens:
+      documents = self._postings.get(token)
+      if documents is None:
+        documents = self._postings[token] = set()
+        if sort_terms:
+          insort(self._terms, token)
+        else:
+          self._terms.append(token)
+      documents.add(key)
+    if id > self._max_id.get(kind, 0):
+      self._max_id[kind] = id
+
+  def _remove(self, key):
+    doc = self._docs.pop(key, None)
+    if doc is None:
+      return
+    for token in doc[1]:
+      documents = self._postings[token]
+      documents.discard(key)
+      if not documents:
+        del self._postings[token]
+        del self._terms[bisect_left(self._terms, token)]
+
+  def apply(self, changes):
+    if self._built_pid != os.getpid():
+      return
+    with self._lock:
+      for action, kind, id, label in changes:
+        if action == 'add':
+          self._add(kind, id, label)
+        else:
+          self._remove((kind, id))
+
+  def remove(self, kind, ids):
+    """Record rows of `kind` deleted without ORM events (bulk deletes).
+
+    Call before the session commits: the tombstones are written in its
+    transaction and this process's index drops the rows on commit.
+    """
+    ids = list(ids)
+    if not ids:
+      return
+    db.session.execute(insert(SearchTombstone), [{'kind': kind, 'doc_id': id} for id in ids])
+    db.session.info.setdefault('search_changes', []).extend(
+      ('remove', kind, id, None) for id in ids
+    )
+
+  # -- queries ------------------------------------------------------------
+
+  def _expand(self, term):
+    start = bisect_left(self._terms, term)
+    matches = []
+    for token in self._terms[start:start + self.max_expansions]:
+      if not token.startswith(term):
+        break
+      matches.append(token)
+    return matches
+
+  def search(self, query, limit=20):
+    self.ensure_built()
+    terms = tokenize(query)
+    if not terms:
+      return []
+
+    with self._lock:
+      per_term = []
+      for term in terms:
+        scores = {}
+        for token in self._expand(term):
+          weight = 2 if token == term else 1
+          for key in self._postings[token]:
+            if scores.get(key, 0) < weight:
+              scores[key] = weight
+        if not scores:
+          return []
+        per_term.append(scores)
+
+      per_term.sort(key=len)
+      ranked = []
+      for key, score in per_term[0].items():
+        total = score
+        for scores in per_term[1:]:
+          other = scores.get(key)
+          if other is None:
+            break
+          total += other
+        else:
+          ranked.append((-total, len(self._docs[key][0]), key))
+
+      ranked.sort()
+      results = [
+        {'type': kind, 'id': id, 'label': self._docs[(kind, id)][0], 'score': -score}
+        for score, _, (kind, id) in ranked[:limit]
+      ]
+    return results
+
+  def stats(self):
+    with self._lock:
+      size = sys.getsizeof(self._docs) + sys.getsizeof(self._postings) + sys.getsizeof(self._terms)
+      for key, (label, tokens) in self._docs.items():
+        size += sys.getsizeof(key) + sys.getsizeof(label) + sys.getsizeof(tokens)
+      for token, documents in self._postings.items():
+        size += sys.getsizeof(token) + sys.getsizeof(documents)
+      return {
+        'documents': len(self._docs),
+        'terms': len(self._terms),
+        'approx_memory_bytes': size,
+        'built': self._built_pid == os.getpid(),
+      }
+
+
+def _utcnow():
+  # updated_at is stored as naive UTC.
+  return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _columns(model, fields):
+  return [model.id] + [getattr(model, field) for field in fields]
+
+
+def _label(row, fields):
+  return ' '.join(getattr(row, field) or '' for field in fields).strip()
+
+
+def _pending(target):
+  return object_session(target).info.setdefault('search_changes', [])
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _apply_search_changes(session):
+  changes = session.info.pop('search_changes', None)
+  if changes:
+    search_index.apply(changes)
+
+
+@event.listens_for(RoutingSession, 'after_soft_rollback')
+def _discard_search_changes(session, previous_transaction):
+  session.info.pop('search_changes', None)
+
+
+search_index = SearchIndex()
@@ -0,0 +1,113 @@
+"""Compiled dump functions for the marshmallow schemas in api.models.
+
+`dump(schema, obj)` returns the same data as `schema.dump(obj)` for model
+instances. The first call for a schema class and field selection generates
+a plain Python function that reads each attribute once and formats it
+inline; that function is cached at module level and reused by every later
+schema instance with the same selection. Fields without a fast path are
+delegated to the marshmallow field itself.
+"""
+from marshmallow import fields, missing
+from marshmallow.decorators import PRE_DUMP, POST_DUMP
+from api.utils.metrics import metrics
+
+_compiled = {}
+
+_NUMBER_FIELDS = (fields.Number, fields.Integer, fields.Float)
+_STRING_FIELDS = (fields.String, fields.Email, fields.Url)
+
+
+def _cache_key(schema):
+  only = frozenset(schema.only) if schema.only is not None else None
+  return (type(schema), only, frozenset(schema.exclude))
+
+
+def _field_expression(i, field, namespace):
+  """Return an expression formatting `v{i}`, registering helpers it needs."""
+  value = f"v{i}"
+  field_type = type(field)
+
+  if field_type in _NUMBER_FIELDS and not field.as_string:
+    namespace[f"_num{i}"] = field.num_type
+    return f"None if {value} is None else _num{i}({value})"
+
+  if field_type in _STRING_FIELDS:
+    namespace[f"_f{i}"] = field
+    return (f"{value} if {value} is None or {value}.__class__ is str "
+            f"else _f{i}._serialize({value}, None, obj)")
+
+  if field_type is fields.DateTime and field.format in (None, 'iso'):
+    return f"None if {value} is None else {value}.isoformat()"
+
+  if field_type is fields.Boolean:
+    namespace[f"_f{i}"] = field
+    return (f"{value} if {value} is None or {value} is True or {value} is False "
+            f"else _f{i}._serialize({value}, None, obj)")
+
+  if field_type is fields.Nested:
+    nested = field.schema
+    if nested._hooks[PRE_DUMP] or nested._hooks[POST_DUMP]:
+      return None
+    namespace[f"_dump{i}"] = compile_schema(nested)
+    if nested.many or field.many:
+      return f"None if {value} is None else [_dump{i}(x) for x in {value}]"
+    return f"None if {value} is None else _dump{i}({value})"
+
+  return None
+
+
+def _build(schema):
+  namespace = {'_missing': missing, '_get_attribute': schema.get_attribute}
+  body = []
+  items = []
+  fallbacks = []
+
+  for i, (name, field) in enumerate(schema.dump_fields.items()):
+    attribute = field.attribute or name
+    key = field.data_key if field.data_key is not None else name
+
+    expression = None
+    if attribute.isidentifier():
+      expression = _field_expression(i, field, namespace)
+
+    if expression is None:
+      namespace[f"_f{i}"] = field
+      body.append(
+        f"  r{i} = _f{i}.serialize({attribute!r}, obj, accessor=_get_attribute)"
+      )
+      items.append(f"    {key!r}: r{i},")
+      fallbacks.append(key)
+    else:
+      body.append(f"  v{i} = obj.{attribute}")
+      items.append(f"    {key!r}: {expression},")
+
+  lines = ["def dump(obj):"] + body + ["  data = {"] + items + ["  }"]
+  for key in fallbacks:
+    lines.append(f"  if data[{key!r}] is _missing:")
+    lines.append(f"    del data[{key!r}]")
+  lines.append("  return data")
+
+  exec("\n".join(lines), namespace)
+  return namespace['dump']
+
+
+def compile_schema(schema):
+  """Return the cached single-object dump function for `schema`."""
+  key = _cache_key(schema)
+  function = _compiled.get(key)
+  if function is None:
+    function = _compiled[key] = _build(schema)
+  return function
+
+
+def dump(schema, obj, many=None):
+  """Drop-in replacement for `schema.dump(obj, many=many)`."""
+  if schema._hooks[PRE_DUMP] or schema._hooks[POST_DUMP]:
+    return schema.dump(obj, many=many)
+
+  function = compile_schema(schema)
+  many = schema.many if many is None else bool(many)
+  with metrics.timed('serialization_duration_seconds', schema=type(schema).__name__):
+    if many:
+      return [function(item) for item in obj]
+    return function(obj)
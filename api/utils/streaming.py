@@ -0,0 +1,16 @@
+from flask import request, current_app
+from api.utils.pagination import iter_keyset
+from api.utils.serializers import dump
+
+
+def stream_requested():
+  return request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def dump_chunks(query, columns, schema, chunk_size=None, descending=False):
+  """Serialize `query` chunk by chunk; only one chunk is alive at a time."""
+  if chunk_size is None:
+    chunk_size = current_app.config.get('STREAM_CHUNK_SIZE', 1000)
+
+  for rows in iter_keyset(query, columns, chunk_size, descending):
+    yield dump(schema, rows)
@@ -0,0 +1,89 @@
+from datetime import datetime, timezone
+from sqlalchemy import update, case
+from api.utils.database import db
+import atexit
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class TimestampBuffer(object):
+  """Collects per-row timestamps in memory and writes them in batches.
+
+  `record()` only touches a dict; a background thread flushes every
+  `flush_interval` seconds, or as soon as `flush_size` rows are pending,
+  with one `UPDATE ... SET column = CASE id WHEN ... END WHERE id IN (...)`
+  per batch. Pending rows are flushed once more at interpreter exit.
+  """
+
+  def __init__(self, model, column, app=None):
+    self.model = model
+    self.column = column
+    self.app = None
+    self.flush_interval = 5
+    self.flush_size = 500
+    self._pending = {}
+    self._lock = threading.Lock()
+    self._wake = threading.Event()
+    self._pid = None
+    if app is not None:
+      self.init_app(app)
+
+  def init_app(self, app):
+    self.app = app
+    self.flush_interval = app.config.get('LAST_LOGIN_FLUSH_INTERVAL', 5)
+    self.flush_size = app.config.get('LAST_LOGIN_FLUSH_SIZE', 500)
+    atexit.register(self.flush)
+
+  def _start(self):
+    with self._lock:
+      if self._pid == os.getpid():
+        return
+      self._pid = os.getpid()
+      threading.Thread(
+        target=self._run, name=f"{self.column}-flusher", daemon=True
+      ).start()
+
+  def record(self, id, when=None):
+    if self._pid != os.getpid():
+      self._start()
+    with self._lock:
+      self._pending[id] = when or datetime.now(timezone.utc)
+      full = len(self._pending) >= self.flush_size
+    if full:
+      self._wake.set()
+
+  def _run(self):
+    while True:
+      self._wake.wait(self.flush_interval)
+      self._wake.clear()
+      self.flush()
+
+  def flush(self):
+    with self._lock:
+      pending, self._pending = self._pending, {}
+    if not pending:
+      return
+
+    key = self.model.id
+    items = list(pending.items())
+    try:
+      with self.app.app_context():
+        for start in range(0, len(items), self.flush_size):
+          batch = dict(items[start:start + self.flush_size])
+          db.session.execute(
+            update(self.model)
+            .where(key.in_(batch))
+            .values({self.column: case(batch, value=key)})
+            .execution_options(synchronize_session=False)
+          )
+        db.session.commit()
+    except Exception as e:
+      logger.error(f"Failed to flush {len(pending)} {self.column} updates: {str(e)}")
+      with self._lock:
+        # Keep whatever is newer so the next flush retries these rows.
+        for id, when in pending.items():
+          if id not in self._pending or self._pending[id] < when:
+            self._pending[id] = when
@@ -0,0 +1,13 @@
+"""ASGI entry point, next to run.py for WSGI servers.
+
+    pip install uvicorn aiomysql     # aiosqlite for a SQLite database
+    uvicorn asgi:application --workers 4
+
+Author and book reads are served natively on the event loop; every other
+route runs through the WSGI app on a thread pool (see api/utils/asgi.py).
+"""
+from main import create_app
+from api.utils.asgi import ASGIApplication
+import api.routes.async_views  # noqa: F401 -- registers the native handlers
+
+application = ASGIApplication(create_app())
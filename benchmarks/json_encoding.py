@@ -0,0 +1,106 @@
+"""Cost of building `response_with` responses for large author/book lists.
+
+Run from the repository root:
+
+    python -m benchmarks.json_encoding --authors 5000 --books-per-author 5
+
+The payloads are dumped once with the compiled serializers. Then three
+paths encode them into a response:
+- the previous `response_with`, which copied the dict and went through
+  jsonify;
+- the current one on the stdlib provider;
+- the current one on orjson, when it is installed.
+All paths are checked to produce the same body first.
+"""
+import argparse
+import json
+
+from flask import make_response, jsonify
+
+from benchmarks.serializers import make_authors, make_books, best_of
+from api.models.authors import AuthorSchema
+from api.models.books import BookSchema
+from api.utils.serializers import dump
+from api.utils import responses as resp
+from api.utils.responses import response_with
+from api.utils.json_provider import orjson
+from main import create_app
+
+
+def legacy_response_with(response, value=None, message=None, error=None,
+                         headers={}, pagination=None):
+  result = {}
+  if value is not None:
+    result.update(value)
+  if message is not None:
+    result.update({'message': message})
+  elif response.get('message', None) is not None:
+    result.update({'message': response['message']})
+  result.update({'code': response['code']})
+  if error is not None:
+    result.update({'errors': error})
+  if pagination is not None:
+    result.update({'pagination': pagination})
+  headers.update({'Access-Control-Allow-Origin': '*'})
+  headers.update({'server': 'Flask REST API'})
+  return make_response(jsonify(result), response['http_code'], headers)
+
+
+def make_app(backend):
+  return create_app({
+    'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+    'SQLALCHEMY_BINDS': {},
+    'READ_REPLICA_BINDS': [],
+    'JSON_BACKEND': backend,
+    'DOCS_ENABLED': False,
+    'SEARCH_BUILD_ON_FIRST_REQUEST': False,
+    'METRICS_ENABLED': False,
+  })
+
+
+def measure(app, build, key, payload, repeat):
+  with app.test_request_context():
+    body = build(resp.SUCCESS_200, value={key: payload}).get_data()
+    seconds = best_of(repeat, lambda: build(resp.SUCCESS_200, value={key: payload}).get_data())
+  return body, seconds
+
+
+def run(name, key, payload, repeat):
+  stdlib = make_app('stdlib')
+  results = [('jsonify (previous)',) + measure(stdlib, legacy_response_with, key, payload, repeat),
+             ('stdlib',) + measure(stdlib, response_with, key, payload, repeat)]
+  if orjson is not None:
+    results.append(('orjson',) + measure(make_app('orjson'), response_with, key, payload, repeat))
+
+  reference = results[0][1]
+  for label, body, _ in results[1:]:
+    if json.loads(body) != json.loads(reference):
+      raise SystemExit(f"{name}: {label} output differs from jsonify")
+
+  size = len(reference) / 1024 / 1024
+  baseline = results[0][2]
+  print(f"{name} ({len(payload):,} items, {size:.1f} MiB)")
+  for label, _, seconds in results:
+    print(f"  {label:<20} {seconds * 1000:9.1f} ms   {size / seconds:8.1f} MiB/s   "
+          f"x{baseline / seconds:.1f}")
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--authors', type=int, default=5000)
+  parser.add_argument('--books-per-author', type=int, default=5)
+  parser.add_argument('--repeat', type=int, default=5)
+  args = parser.parse_args()
+
+  authors = make_authors(args.authors, args.books_per_author)
+  books = make_books(args.authors * args.books_per_author)
+  if orjson is None:
+    print("orjson is not installed; comparing the stdlib paths only")
+
+  run("authors with books", 'authors',
+      dump(AuthorSchema(many=True, exclude=('book_count',)), authors), args.repeat)
+  run("books", 'books', dump(BookSchema(many=True), books), args.repeat)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,110 @@
+"""Cold start cost: import time, create_app() and time to first request.
+
+Run from the repository root:
+
+    python -m benchmarks.startup --runs 10
+    python -m benchmarks.startup --no-docs --importtime 15
+
+Every run happens in a fresh interpreter against a throwaway SQLite
+database, so no MySQL is needed. The first request is an authenticated
+GET /api/authors/ through the test client.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+CHILD = r'''
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+app = main.create_app(json.loads(sys.argv[1]))
+created = time.perf_counter()
+from flask_jwt_extended import create_access_token
+with app.app_context():
+  token = create_access_token(identity='benchmark')
+response = app.test_client().get(
+  '/api/authors/', headers={'Authorization': 'Bearer ' + token}
+)
+assert response.status_code == 200, response.status_code
+served = time.perf_counter()
+print(json.dumps({
+  'import': imported - started,
+  'create_app': created - imported,
+  'first_request': served - created,
+  'total': served - started,
+}))
+'''
+
+SETUP = r'''
+import json, sys
+import main
+app = main.create_app(json.loads(sys.argv[1]))
+with app.app_context():
+  main.db.create_all()
+  from api.models.users import User
+  main.db.session.add(User(username='benchmark', email='benchmark@example.com',
+                           password='-', is_verified=True))
+  main.db.session.commit()
+'''
+
+
+def child(code, overrides, extra=()):
+  return subprocess.run(
+    [sys.executable, *extra, '-c', code, json.dumps(overrides)],
+    capture_output=True, text=True, check=True,
+  )
+
+
+def import_profile(overrides, top):
+  """Slowest modules by cumulative import time, from -X importtime."""
+  stderr = child(CHILD, overrides, ('-X', 'importtime')).stderr
+  rows = []
+  for line in stderr.splitlines():
+    if not line.startswith('import time:') or 'cumulative' in line:
+      continue
+    _, cumulative, name = line[len('import time:'):].split('|')
+    rows.append((int(cumulative), name.rstrip()))
+  rows.sort(reverse=True)
+  return rows[:top]
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--runs', type=int, default=10)
+  parser.add_argument('--no-docs', action='store_true',
+                      help="start with DOCS_ENABLED=False")
+  parser.add_argument('--importtime', type=int, default=0, metavar='N',
+                      help="also list the N slowest imports")
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as folder:
+    overrides = {
+      'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(folder, 'startup.db')}",
+      'SQLALCHEMY_BINDS': {},
+      'READ_REPLICA_BINDS': [],
+      'JWT_SECRET_KEY': 'startup-benchmark-secret-key-0123456789',
+      'UPLOAD_FOLDER': folder,
+      'DOCS_ENABLED': not args.no_docs,
+    }
+    child(SETUP, overrides)
+
+    samples = [json.loads(child(CHILD, overrides).stdout) for _ in range(args.runs)]
+    print(f"{args.runs} cold starts, docs {'off' if args.no_docs else 'on'}")
+    for phase in ('import', 'create_app', 'first_request', 'total'):
+      values = sorted(sample[phase] * 1000 for sample in samples)
+      print(f"{phase:<14} median {statistics.median(values):8.1f} ms   "
+            f"min {values[0]:8.1f} ms   max {values[-1]:8.1f} ms")
+
+    if args.importtime:
+      print("\nslowest imports (cumulative):")
+      for micros, name in import_profile(overrides, args.importtime):
+        print(f"{micros / 1000:8.1f} ms  {name}")
+
+
+if __name__ == '__main__':
+  main()
@@ -1,86 +1,148 @@
 
 import os
 import logging
-from flask import Flask,send_from_directory, jsonify
-from flask_swagger import swagger
-from flask_swagger_ui import get_swaggerui_blueprint
-from api.utils.database import db
+import click
+from flask import Flask, send_from_directory
+from flask.cli import with_appcontext
+from api.utils.database import db, replicas
 from api.config.config import ProductionConfig, TestingConfig, DevelopmentConfig
-from flask_jwt_extended import JWTManager 
 from api.utils.responses import response_with
 import api.utils.responses as resp
 from api.routes.authors import author_routes
 from api.routes.books import book_routes
 from api.routes.users import user_routes
-from api.utils.email import mail
- 
+from api.routes.search import search_routes
+from api.utils.email import mail, mail_queue
+from api.utils.cache import cache
+from api.utils.hashing import hasher
+from api.models.users import last_logins
+from api.utils.search import search_index
+from api.utils.avatars import send_avatar, collect_garbage
+from api.utils.metrics import metrics
+from api.utils.profiler import sql_profiler
+from api.utils.json_provider import init_json
+from api.utils.compression import compressor
+from api.utils.auth import jwt
+
 SWAGGER_URL = '/api/docs'
 API_SPEC_FILE = '/static/swagger.yaml'
-app = Flask(__name__, template_folder='api/templates', static_folder='api/static')
 
 
-if os.environ.get('WORK_ENV') == 'PROD':
-    app_config = ProductionConfig
-elif os.environ.get('WORK_ENV') == 'TEST':
-    app_config = TestingConfig
-else:
-    app_config = DevelopmentConfig
+def get_config():
+    if os.environ.get('WORK_ENV') == 'PROD':
+        return ProductionConfig
+    elif os.environ.get('WORK_ENV') == 'TEST':
+        return TestingConfig
+    return DevelopmentConfig
 
-app.config.from_object(app_config)
-app.config['SECRET_KEY'] = 'the random string' # Explore how to use env
 
-swaggerui_blueprint = get_swaggerui_blueprint(
-   SWAGGER_URL, 
-   API_SPEC_FILE,
-    config={"app_name": "Flask Author DB"}
-)
+def create_app(config=None):
+    """Build the application.
 
-db.init_app(app)
-jwt = JWTManager(app)
-mail.init_app(app)
-with app.app_context():
-    db.create_all()
+    `config` is a config class, or a mapping of overrides applied on top of
+    the class selected by WORK_ENV. Nothing here talks to the database; run
+    `flask --app main init-db` to create the schema.
+    """
+    app = Flask(__name__, template_folder='api/templates', static_folder='api/static')
+
+    if config is None or isinstance(config, dict):
+        overrides = config or {}
+        config = get_config()
+    else:
+        overrides = {}
+    app.config.from_object(config)
+    app.config['SECRET_KEY'] = 'the random string' # Explore how to use env
+    app.config.update(overrides)
+    init_json(app)
+
+    db.init_app(app)
+    replicas.init_app(app)
+    jwt.init_app(app)
+    mail.init_app(app)
+    mail_queue.init_app(app)
+    cache.init_app(app)
+    hasher.init_app(app)
+    last_logins.init_app(app)
+    search_index.init_app(app)
+    metrics.init_app(app)
+    sql_profiler.init_app(app)
+    compressor.init_app(app)
+
+    app.register_blueprint(author_routes, url_prefix='/api/authors')
+    app.register_blueprint(book_routes, url_prefix='/api/books')
+    app.register_blueprint(user_routes, url_prefix='/api/users')
+    app.register_blueprint(search_routes, url_prefix='/api/search')
+    if app.config.get('DOCS_ENABLED', True):
+        register_docs(app)
+
+    register_handlers(app)
+    app.cli.add_command(init_db)
+    app.cli.add_command(collect_avatars)
+    return app
+
+
+def register_docs(app):
+    # Imported here so that workers running without docs never load it.
+    from flask_swagger_ui import get_swaggerui_blueprint
 
-app.register_blueprint(author_routes, url_prefix='/api/authors')
-app.register_blueprint(book_routes, url_prefix='/api/books')
-app.register_blueprint(user_routes, url_prefix='/api/users')
-app.register_blueprint(swaggerui_blueprint, url_prefix='/api/docs')
+    swaggerui_blueprint = get_swaggerui_blueprint(
+       SWAGGER_URL,
+       API_SPEC_FILE,
+        config={"app_name": "Flask Author DB"}
+    )
+    app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
 
-@app.route('/avatar/<filename>')
-def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
-# START GLOBAL HTTP CONFIGURATIONS
 
-@app.after_request
-def add_header(response):
-    return response
+def register_handlers(app):
+    @app.route('/avatar/<filename>')
+    def uploaded_file(filename):
+        return send_avatar(filename)
 
-@app.errorhandler(400)
-def bad_request(e):
-    logging.error(e)
-    return response_with(resp.BAD_REQUEST_400)
+    # START GLOBAL HTTP CONFIGURATIONS
 
-@app.errorhandler(500)
-def server_error(e):
-    logging.error(e)
-    return response_with(resp.SERVER_ERROR_500)
+    @app.after_request
+    def add_header(response):
+        return response
+
+    @app.errorhandler(400)
+    def bad_request(e):
+        logging.error(e)
+        return response_with(resp.BAD_REQUEST_400)
+
+    @app.errorhandler(500)
+    def server_error(e):
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_500)
+
+    @app.errorhandler(404)
+    def not_found(e):
+        logging.error(e)
+        return response_with(resp.SERVER_ERROR_404)
+
+    @app.route('/static/<path:filename>')
+    def static_files(filename):
+        return send_from_directory('static', filename)
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db():
+    """Create any missing tables."""
+    db.create_all()
+    click.echo("Database tables created")
 
-@app.errorhandler(404)
-def not_found(e):
-    logging.error(e)
-    return response_with(resp.SERVER_ERROR_404)
 
-@app.route('/static/<path:filename>')
-def static_files(filename):
-    return send_from_directory('static', filename)
+@click.command('collect-avatars')
+@with_appcontext
+def collect_avatars():
+    """Delete avatar files no author references any more."""
+    click.echo(f"Removed {collect_garbage()} unreferenced avatar(s)")
 
-    
 
-    
 if __name__ == "__main__":
-    app.run(
+    create_app().run(
         port=5000,
         host="0.0.0.0",
         debug=True,
         use_reloader=True,
-        )
\ No newline at end of file
+        )
@@ -1,4 +1,6 @@
-from main import app as application
+from main import create_app
+
+application = create_app()
 
 if __name__  == "__main__":
-  application.run()
\ No newline at end of file
+  application.run()